@@ -0,0 +1,72 @@
+""" Отчет по компактным типам признаков(conf.COMPACT_DTYPES): память матрицы признаков и ROC AUC модели.
+
+Признаки строятся дважды - в обычных типах и в компактных, на обоих вариантах обучается
+RandomForest финальной модели с одинаковым разбиением и random_state. Память - размер
+датафрейма признаков и матрицы, которая передается модели(data_iter_final.model_matrix).
+
+Запуск из каталога notebooks(пути в libs.config относительные):
+    PYTHONPATH=.. python -m libs.benchmarks.compact_dtypes
+    PYTHONPATH=.. python -m libs.benchmarks.compact_dtypes --generator data_iter1 \
+        --events ../data/events_data_test.zip --submissions ../data/submission_data_test.zip
+"""
+import argparse
+import importlib
+import json
+import time
+
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import train_test_split
+
+import libs.config as conf
+from libs import data_iter_final as di
+
+
+def measure(get_x_y, events, submissions, compact, seed=42):
+    """ память признаков и ROC AUC модели в обычных(compact=False) или компактных типах """
+    conf.COMPACT_DTYPES = compact
+    X, y = get_x_y(events, submissions)
+    X_matrix = di.model_matrix(X)
+    X_train, X_test, y_train, y_test = train_test_split(X_matrix, y.values, test_size=0.3,
+                                                        random_state=seed, stratify=y.values)
+    rf = RandomForestClassifier(n_estimators=100, n_jobs=conf.N_JOBS, min_samples_leaf=10, min_samples_split=10,
+                                class_weight='balanced', random_state=seed)
+    start = time.perf_counter()
+    rf.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+    return {'compact': compact,
+            'shape': list(X.shape),
+            'frame_mb': X.memory_usage(deep=True).sum() / 2 ** 20,
+            'matrix_mb': X_matrix.nbytes / 2 ** 20,
+            'matrix_dtype': str(X_matrix.dtype),
+            'fit_seconds': fit_seconds,
+            'roc_auc': roc_auc_score(y_test, rf.predict_proba(X_test)[:, 1])}
+
+
+def run(generator='data_iter_final', events_fname=None, submissions_fname=None):
+    """ замеры в обычных и компактных типах """
+    get_x_y = importlib.import_module(f'libs.{generator}').get_x_y
+    events = pd.read_csv(events_fname or f"{conf.DATA_DIR}/event_data_train.zip")
+    submissions = pd.read_csv(submissions_fname or f"{conf.DATA_DIR}/submissions_data_train.zip")
+    compact_before = conf.COMPACT_DTYPES
+    try:
+        return [measure(get_x_y, events, submissions, compact) for compact in (False, True)]
+    finally:
+        conf.COMPACT_DTYPES = compact_before
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='память и ROC AUC признаков в компактных типах')
+    parser.add_argument('--generator', default='data_iter_final', help='модуль libs с функцией get_x_y')
+    parser.add_argument('--events', default=None, help='путь до данных events')
+    parser.add_argument('--submissions', default=None, help='путь до данных submissions')
+    args = parser.parse_args(argv)
+    results = run(args.generator, args.events, args.submissions)
+    print(json.dumps(results, indent=2))
+    print(f"matrix memory saved: {1 - results[1]['matrix_mb'] / results[0]['matrix_mb']:.1%}, "
+          f"roc auc diff: {results[1]['roc_auc'] - results[0]['roc_auc']:+.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+""" Замер пикового потребления памяти при построении сущностей featuretools(featuretools_ds.create_es).
+
+Каждый режим запускается в отдельном процессе, чтобы пик одного не влиял на другой.
+Память - прирост пикового RSS процесса(VmHWM, сбрасывается перед create_es) относительно
+RSS после загрузки и подготовки данных. Только Linux.
+
+Замер на featuretools 0.8.0(тестовые пользователи, размноженные scale раз):
+    scale   строк       обычный, МБ   low_memory, МБ   снижение пика
+    1       317 029     52.8          45.2             14.5%
+    5       1 585 145   281.7         251.5            10.7%
+    10      3 170 290   619.6         530.8            14.3%
+Признаки calculate_feature_matrix в обоих режимах совпадают, выигрыш небольшой,
+поэтому в create_es и prepare_ft экономный режим по умолчанию выключен.
+
+Запуск из каталога notebooks(пути в libs.config относительные):
+    PYTHONPATH=.. python -m libs.benchmarks.es_memory --scale 10
+"""
+import argparse
+import json
+import multiprocessing
+import time
+
+import pandas as pd
+
+import libs.config as conf
+import libs.data_helpers as dh
+
+
+def read_rss_mb(field='VmRSS'):
+    """ RSS процесса в МБ: текущий(VmRSS) или пиковый(VmHWM) """
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 2 ** 10
+    raise KeyError(field)
+
+
+def reset_peak_rss():
+    """ сбросить пиковый RSS процесса до текущего """
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+
+
+def load_interactions(scale=1):
+    """ взаимодействия из тестовых данных, при scale > 1 пользователи размножаются с новыми user_id """
+    events = pd.read_csv(f"{conf.DATA_DIR}/events_data_test.zip")
+    submissions = pd.read_csv(f"{conf.DATA_DIR}/submission_data_test.zip")
+    user_offset = max(events.user_id.max(), submissions.user_id.max()) + 1
+    events = pd.concat([events.assign(user_id=events.user_id + i * user_offset) for i in range(scale)])
+    submissions = pd.concat([submissions.assign(user_id=submissions.user_id + i * user_offset)
+                             for i in range(scale)])
+    interactions = dh.preprocess_timestamp_cols(dh.create_interaction(events, submissions), day_as_int=True)
+    return interactions.drop(['day', 'timestamp'], axis=1)
+
+
+def measure_create_es(low_memory, scale, queue):
+    from libs.data import featuretools_ds as ft_ds
+    from libs.features.featuretools_x import get_ft_feature_names
+
+    interactions = load_interactions(scale)
+    course_df = pd.read_csv(f"{conf.DATA_DIR}/hb_course_info.csv")
+    features = get_ft_feature_names() if low_memory else None
+    rss_before = read_rss_mb()
+    reset_peak_rss()
+    start = time.perf_counter()
+    ft_ds.create_es(interactions, course_df, low_memory, features)
+    queue.put({'low_memory': low_memory,
+               'n_rows': len(interactions),
+               'seconds': time.perf_counter() - start,
+               'rss_before_mb': rss_before,
+               'peak_increase_mb': read_rss_mb('VmHWM') - rss_before})
+
+
+def run(scale=1):
+    """ замеры create_es в обычном и экономном режимах """
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for low_memory in (False, True):
+        queue = ctx.Queue()
+        process = ctx.Process(target=measure_create_es, args=(low_memory, scale, queue))
+        process.start()
+        # результат - небольшой словарь, поэтому можно дождаться процесса до чтения очереди
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError(f'замер low_memory={low_memory} упал с кодом {process.exitcode}')
+        results.append(queue.get())
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='пиковая память featuretools_ds.create_es')
+    parser.add_argument('--scale', type=int, default=1, help='во сколько раз размножить тестовых пользователей')
+    args = parser.parse_args(argv)
+    results = run(args.scale)
+    print(json.dumps(results, indent=2))
+    print(f"peak reduction: {1 - results[1]['peak_increase_mb'] / results[0]['peak_increase_mb']:.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+""" Замер времени и пиковой памяти этапов пайплайна признаков на синтетических данных(см. synthetic).
+
+Каждый масштаб(колво пользователей) считается в отдельном процессе. Перед каждым этапом
+сбрасывается пиковый RSS процесса(VmHWM), поэтому память этапа - прирост пика относительно
+RSS перед этапом. Только Linux. Этапы повторяют data_iter_final.get_x_y:
+    preprocess_timestamp_cols, create_interaction, truncate_data_by_nday, create_user_data,
+    get_y, gen_user_step_scores, tsfresh(признаки временных рядов через ts_native_ds),
+    gen_interact_features, assemble_features
+
+Результаты пишутся в JSON, с --baseline сравниваются с прошлым запуском: этапы, которые стали
+медленнее или тяжелее больше чем на --tolerance(и больше шума замера NOISE_FLOOR), считаются
+регрессией(код возврата 1).
+
+Запуск из каталога notebooks(пути в libs.config относительные):
+    PYTHONPATH=.. python -m libs.benchmarks.pipeline --users 10000 100000 --out bench.json
+    PYTHONPATH=.. python -m libs.benchmarks.pipeline --users 10000 100000 --baseline bench.json
+"""
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+
+import libs.config as conf
+from libs.benchmarks.es_memory import read_rss_mb, reset_peak_rss
+
+DEFAULT_USERS = (10000, 100000, 1000000)
+# рост меньше этих значений считается шумом замера, а не регрессией
+NOISE_FLOOR = {'seconds': 0.05, 'peak_increase_mb': 16}
+
+
+def run_stages(events, submissions):
+    """ выполнить этапы пайплайна и замерить каждый
+
+    Returns
+    -------
+        list of dict: stage, seconds, peak_increase_mb
+    """
+    import libs.data_helpers as dh
+    import libs.features.step_progress as fsp
+    from libs import data_iter1 as di1
+    from libs.data import ts_native_ds
+    from libs.data.prepared import PreparedData
+    from libs.data_iter_auto import get_ts_feature_names
+    from libs.data_iter_final import SCORE_STEP_IDS
+    from libs.features.step_weight import SW_COL_NAME, calc_steps_stat, gen_user_step_scores
+
+    stages = []
+
+    def stage(name, func, *args):
+        rss_before = read_rss_mb()
+        reset_peak_rss()
+        start = time.perf_counter()
+        result = func(*args)
+        stages.append({'stage': name,
+                       'seconds': time.perf_counter() - start,
+                       'peak_increase_mb': read_rss_mb('VmHWM') - rss_before})
+        return result
+
+    prepared = PreparedData(events, submissions)
+    stage('preprocess_timestamp_cols', lambda: (prepared.events, prepared.submissions))
+    stage('create_interaction', lambda: prepared.interactions)
+    stage('truncate_data_by_nday', lambda: (prepared.events_nday, prepared.submissions_nday,
+                                            prepared.interactions_nday))
+    users_data = stage('create_user_data', di1.get_x, events, submissions, prepared)
+    stage('get_y', lambda: prepared.y)
+    hard_steps_weight = calc_steps_stat(prepared.interactions)[SW_COL_NAME]
+    user_step_scores = stage('gen_user_step_scores', gen_user_step_scores, events, submissions, prepared,
+                             hard_steps_weight, SCORE_STEP_IDS)
+    ts_features = stage('tsfresh', lambda: ts_native_ds.gen_ts_features(
+        ts_native_ds.prep_ts_interact(prepared.interactions_nday), get_ts_feature_names()))
+    interact_features = stage('gen_interact_features', fsp.gen_interact_features, users_data)
+    stage('assemble_features', dh.assemble_features, prepared.user_ids,
+          [(ts_features, None), (interact_features, None), (user_step_scores, None)])
+    return stages
+
+
+def measure(n_users, seed, queue):
+    from libs.benchmarks.synthetic import gen_data
+
+    start = time.perf_counter()
+    events, submissions = gen_data(n_users, seed=seed)
+    gen_seconds = time.perf_counter() - start
+    stages = run_stages(events, submissions)
+    queue.put({'n_users': n_users,
+               'n_events': len(events),
+               'n_submissions': len(submissions),
+               'data_period_days': conf.DATA_PERIOD_DAYS,
+               'gen_seconds': gen_seconds,
+               'total_seconds': sum(stage['seconds'] for stage in stages),
+               'peak_rss_mb': read_rss_mb('VmHWM'),
+               'stages': stages})
+
+
+def run(users=DEFAULT_USERS, seed=0, timeout=None):
+    """ замеры по каждому масштабу в отдельном процессе
+
+    Parameters
+    ----------
+    timeout: float
+        предел времени замера одного масштаба в секундах, None - без предела
+    """
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for n_users in users:
+        queue = ctx.Queue()
+        process = ctx.Process(target=measure, args=(n_users, seed, queue))
+        process.start()
+        # результат - небольшой словарь, поэтому можно дождаться процесса до чтения очереди
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+            raise TimeoutError(f'замер {n_users} пользователей не закончился за {timeout} с')
+        if process.exitcode != 0:
+            raise RuntimeError(f'замер {n_users} пользователей упал с кодом {process.exitcode}')
+        results.append(queue.get())
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """ сравнить замеры с базовыми по этапам с одинаковым колвом пользователей
+
+    Returns
+    -------
+        list of dict: n_users, stage, метрика, было, стало, отношение и признак регрессии
+    """
+    baseline_stages = {(result['n_users'], stage['stage']): stage
+                       for result in baseline for stage in result['stages']}
+    rows = []
+    for result in results:
+        for stage in result['stages']:
+            base = baseline_stages.get((result['n_users'], stage['stage']))
+            if base is None:
+                continue
+            for metric in ('seconds', 'peak_increase_mb'):
+                ratio = stage[metric] / base[metric] if base[metric] > 0 else float('nan')
+                rows.append({'n_users': result['n_users'], 'stage': stage['stage'], 'metric': metric,
+                             'baseline': base[metric], 'current': stage[metric], 'ratio': ratio,
+                             'regression': (ratio > 1 + tolerance
+                                            and stage[metric] - base[metric] > NOISE_FLOOR[metric])})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='время и память этапов пайплайна признаков')
+    parser.add_argument('--users', type=int, nargs='+', default=list(DEFAULT_USERS), help='колво пользователей')
+    parser.add_argument('--seed', type=int, default=0, help='зерно генератора синтетических данных')
+    parser.add_argument('--out', default=None, help='файл для сохранения результатов в JSON')
+    parser.add_argument('--baseline', default=None, help='JSON прошлого запуска для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='допустимый относительный рост времени/памяти')
+    parser.add_argument('--timeout', type=float, default=None, help='предел времени замера одного масштаба, с')
+    args = parser.parse_args(argv)
+
+    results = run(args.users, args.seed, args.timeout)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            rows = compare(results, json.load(f), args.tolerance)
+        for row in rows:
+            print('{n_users:>8} {stage:<26} {metric:<17} {baseline:>10.3f} -> {current:>10.3f} '
+                  '{ratio:>6.2f}x{mark}'.format(mark=' REGRESSION' if row['regression'] else '', **row))
+        if any(row['regression'] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+""" Синтетические события и сабмиты, похожие на данные Stepik(events_data, submission_data).
+
+Пользователь проходит степы курса из hb_course_info.csv по порядку и бросает курс после
+случайного(геометрического) колва степов. На каждом степе есть discovered и один или несколько viewed,
+на практике started_attempt и сабмиты: несколько wrong и correct с вероятностью по
+step_correct_ratio, passed - после просмотра теории или верного решения практики.
+Действия пользователя идут сессиями: внутри сессии минуты между степами, между
+сессиями перерывы в дни, начало обучения равномерно распределено по периоду курса.
+"""
+import numpy as np
+import pandas as pd
+
+import libs.config as conf
+from libs.data.event_store import EVENTS_COLUMNS, SUBMISSIONS_COLUMNS
+
+SECONDS_IN_DAY = 60 * 60 * 24
+# период начала обучения пользователей(как в исходных данных: 2015-06 - 2018-05)
+START_TIMESTAMP = 1434340800
+END_TIMESTAMP = 1526774400
+# типы степов без проверки ответа
+THEORY_BLOCKS = ('text', 'video')
+
+
+def gen_data(n_users, course_df=None, mean_steps=20, seed=0):
+    """ сгенерировать действия и сабмиты пользователей
+
+    Parameters
+    ----------
+    n_users: int
+        колво пользователей
+    course_df: pandas.DataFrame
+        информация о степах(hb_course_info.csv), по умолчанию читается из conf.DATA_DIR
+    mean_steps: float
+        среднее колво степов, которые проходит пользователь до того как бросит курс
+    seed: int
+        зерно генератора случайных чисел
+
+    Returns
+    -------
+        (events, submissions) - pandas.DataFrame в формате events_data_*.zip и submission_data_*.zip
+    """
+    if course_df is None:
+        course_df = pd.read_csv(f"{conf.DATA_DIR}/hb_course_info.csv")
+    rng = np.random.RandomState(seed)
+    course_df = course_df.sort_values(['section_position', 'unit_position', 'step_position'])
+    step_ids = course_df.step_id.values
+    is_practice = ~course_df['step_block.name'].isin(THEORY_BLOCKS).values
+    correct_ratio = course_df.step_correct_ratio.fillna(0.5).clip(0.05, 1).values
+
+    # визиты степов: каждый пользователь идет по курсу с начала, пока не бросит
+    user_ids = rng.permutation(n_users) + 1
+    n_visits = np.minimum(rng.geometric(1 / mean_steps, n_users), len(step_ids))
+    visit_user = np.repeat(np.arange(n_users), n_visits)
+    user_first_visit = np.repeat(np.cumsum(n_visits) - n_visits, n_visits)
+    visit_step = np.arange(len(visit_user)) - user_first_visit
+
+    # время визита: минуты между степами внутри сессии и перерывы в дни между сессиями
+    gaps = rng.exponential(120, len(visit_user))
+    gaps += (rng.rand(len(visit_user)) < 0.1) * rng.exponential(2 * SECONDS_IN_DAY, len(visit_user))
+    gaps[user_first_visit == np.arange(len(visit_user))] = 0
+    elapsed = np.cumsum(gaps)
+    elapsed -= elapsed[user_first_visit]
+    visit_ts = rng.randint(START_TIMESTAMP, END_TIMESTAMP, n_users)[visit_user] + elapsed.astype(np.int64)
+
+    # практика: попытка, несколько неверных сабмитов и верный с вероятностью по сложности степа
+    practice = is_practice[visit_step]
+    started = practice & (rng.rand(len(visit_user)) < 0.8)
+    solved = started & (rng.rand(len(visit_user)) < correct_ratio[visit_step] ** 0.5)
+    n_wrong = np.where(started, rng.geometric(correct_ratio[visit_step]) - 1, 0)
+    passed = np.where(practice, solved, rng.rand(len(visit_user)) < 0.95)
+    # степ могут просматривать несколько раз
+    n_views = rng.geometric(0.6, len(visit_user))
+    view_visits = np.repeat(np.arange(len(visit_user)), n_views)
+    view_number = np.arange(len(view_visits)) - np.repeat(np.cumsum(n_views) - n_views, n_views)
+
+    events = pd.concat([
+        _actions(visit_user, visit_step, visit_ts, np.ones(len(visit_user), dtype=bool), 'discovered'),
+        _actions(visit_user[view_visits], visit_step[view_visits], visit_ts[view_visits] + 30 * view_number,
+                 np.ones(len(view_visits), dtype=bool), 'viewed'),
+        _actions(visit_user, visit_step, visit_ts + 5, started, 'started_attempt'),
+        _actions(visit_user, visit_step, visit_ts + 60 * (n_wrong + 1), passed, 'passed'),
+    ])
+    wrong_visits = np.repeat(np.arange(len(visit_user)), n_wrong)
+    wrong_number = np.arange(len(wrong_visits)) - np.repeat(np.cumsum(n_wrong) - n_wrong, n_wrong)
+    submissions = pd.concat([
+        _actions(visit_user[wrong_visits], visit_step[wrong_visits], visit_ts[wrong_visits] + 60 * (wrong_number + 1),
+                 np.ones(len(wrong_visits), dtype=bool), 'wrong', 'submission_status'),
+        _actions(visit_user, visit_step, visit_ts + 60 * (n_wrong + 1), solved, 'correct', 'submission_status'),
+    ])
+
+    for df in (events, submissions):
+        df['user_id'] = user_ids[df.user_id.values]
+        df['step_id'] = step_ids[df.step_id.values]
+    events = events.sort_values('timestamp', kind='mergesort').reset_index(drop=True)
+    submissions = submissions.sort_values('timestamp', kind='mergesort').reset_index(drop=True)
+    return events[EVENTS_COLUMNS], submissions[SUBMISSIONS_COLUMNS]
+
+
+def _actions(visit_user, visit_step, timestamp, mask, action, action_col='action'):
+    return pd.DataFrame({'step_id': visit_step[mask], 'timestamp': timestamp[mask],
+                         action_col: action, 'user_id': visit_user[mask]})
@@ -2,6 +2,8 @@
 DATA_DIR = "../data"
 # каталог со сгенерированными датасетами для обучения
 PROCESSED_DATA_DIR = f"{DATA_DIR}/processed"
+# каталог колоночного кэша исходных и сгенерированных данных
+STORE_DIR = f"{PROCESSED_DATA_DIR}/store"
 # каталог хранения отчетов по прогнозам
 REPORTS_DIR = "../reports"
 # каталог хранения бинарников модели
@@ -11,3 +13,16 @@ BIN_MODELS_DIR = "../bin_models"
 DATA_PERIOD_DAYS = 2
 ACTION_CATEGORIES = ('discovered', 'viewed', 'started_attempt', 'passed')
 SUBMISSION_STATUSES = ('wrong', 'correct')
+# колво процессов для параллельного расчета признаков(1 - считать в текущем процессе).
+# Шарды пользователей процессы читают через memory-map(см. utils.parallel), выигрыш есть только на нескольких ядрах
+N_JOBS = 1
+# каталог кэша матриц признаков(см. libs.utils.feature_cache)
+FEATURE_CACHE_DIR = f"{STORE_DIR}/features"
+# максимальный размер кэша матриц признаков в МБ(0 - кэш отключен)
+FEATURE_CACHE_MAX_MB = 2048
+# хранить признаки в компактных типах(int32 id, uint16/uint32 счетчики, float32 признаки)
+# и отдавать модели float32 матрицу, см. libs.benchmarks.compact_dtypes
+COMPACT_DTYPES = False
+# записывать время, строки и память вызовов функций пайплайна(см. libs.utils.profiling),
+# также включается переменной окружения LIBS_PROFILE=1
+PROFILE = False
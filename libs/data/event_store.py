@@ -0,0 +1,336 @@
+""" Колоночное хранилище для сырых данных и сгенерированных датасетов.
+
+CSV (в том числе запакованные в zip) один раз разбираются и сохраняются
+в каталог, где каждый столбец лежит отдельным .npy файлом. При следующих
+загрузках столбцы открываются через memory-map. Рядом сохраняется отпечаток
+исходного файла: если исходник изменился, кэш пересобирается.
+
+pandas при сборке датафрейма копирует столбцы одного типа в общий блок, поэтому
+load_frame/load_rows читают в память выбранные столбцы(и строки) целиком.
+Без копирования столбцы отдает только load_columns(массивы numpy через memory-map).
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import libs.config as conf
+
+META_FNAME = 'meta.json'
+
+# столбцы и их типы для данных о действиях пользователей
+EVENTS_COLUMNS = ['step_id', 'timestamp', 'action', 'user_id']
+EVENTS_DTYPES = {'step_id': np.int32, 'user_id': np.int32, 'timestamp': np.int64}
+EVENTS_CATEGORIES = {'action': conf.ACTION_CATEGORIES}
+
+# столбцы и их типы для данных сабмитов практики
+SUBMISSIONS_COLUMNS = ['step_id', 'timestamp', 'submission_status', 'user_id']
+SUBMISSIONS_DTYPES = {'step_id': np.int32, 'user_id': np.int32, 'timestamp': np.int64}
+SUBMISSIONS_CATEGORIES = {'submission_status': conf.SUBMISSION_STATUSES}
+
+
+def file_fingerprint(fname, block_size=1 << 20):
+    """ отпечаток(sha1) содержимого файла
+
+    Parameters
+    ----------
+    fname: string
+        путь до файла
+    block_size: int
+        размер блока чтения в байтах
+    """
+    sha = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def save_frame(df, store_dir, fingerprint=None):
+    """ сохранить датафрейм в колоночном формате(каждый столбец отдельный .npy файл)
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        датафрейм, индекс не сохраняется
+    store_dir: string
+        каталог хранилища
+    fingerprint: string
+        отпечаток исходных данных, по которому проверяется актуальность кэша
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    columns = []
+    for i, col in enumerate(df.columns):
+        col_meta = {'name': col, 'file': f'col_{i}.npy', 'kind': 'values'}
+        values = df[col]
+        if values.dtype == object:
+            values = pd.Categorical(values)
+            col_meta['kind'] = 'object'
+        elif pd.api.types.is_categorical_dtype(values):
+            values = values.values
+            col_meta['kind'] = 'category'
+            col_meta['ordered'] = bool(values.ordered)
+
+        if col_meta['kind'] == 'values':
+            data = values.values
+        else:
+            col_meta['categories'] = values.categories.tolist()
+            data = values.codes
+        np.save(os.path.join(store_dir, col_meta['file']), data)
+        columns.append(col_meta)
+
+    meta = {'fingerprint': fingerprint, 'n_rows': len(df), 'columns': columns}
+    # метаданные пишем последними, чтобы недописанный кэш не считался валидным
+    meta_fname = os.path.join(store_dir, META_FNAME)
+    with open(meta_fname + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_fname + '.tmp', meta_fname)
+
+
+def read_meta(store_dir):
+    """ прочитать метаданные хранилища, None если хранилища нет """
+    return read_meta_file(os.path.join(store_dir, META_FNAME))
+
+
+def read_meta_file(fname):
+    """ прочитать json файл метаданных, None если файла нет """
+    try:
+        with open(fname) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def load_columns(store_dir, columns=None, mmap_mode='r', rows=None):
+    """ столбцы колоночного хранилища без сборки датафрейма. Числовые столбцы - массивы,
+    открытые через memory-map(без копирования в память), категориальные и строковые декодируются
+
+    Parameters
+    ----------
+    store_dir: string
+        каталог хранилища
+    columns: list of string
+        загружаемые столбцы, по умолчанию все
+    mmap_mode: string
+        режим memory-map для np.load, None - читать в память целиком
+    rows: slice
+        строки(например slice(start, stop)), декодируются и читаются только они. По умолчанию все
+
+    Returns
+    -------
+        dict столбец -> значения в порядке хранилища(или columns)
+    """
+    meta = _read_meta_or_raise(store_dir)
+    data = {}
+    for col_meta in _select_columns(meta, columns):
+        values = np.load(os.path.join(store_dir, col_meta['file']), mmap_mode=mmap_mode)
+        data[col_meta['name']] = _decode_column(values if rows is None else values[rows], col_meta)
+    return data
+
+
+def load_frame(store_dir, mmap_mode='r', columns=None):
+    """ загрузить датафрейм из колоночного хранилища. Выбранные столбцы читаются в память
+    целиком(pandas копирует их в блоки), невыбранные не читаются
+
+    Parameters
+    ----------
+    store_dir: string
+        каталог хранилища
+    mmap_mode: string
+        режим memory-map для np.load, None - читать в память целиком
+    columns: list of string
+        загружаемые столбцы, по умолчанию все
+    """
+    data = load_columns(store_dir, columns, mmap_mode)
+    return pd.DataFrame(data, columns=list(data))
+
+
+def load_rows(store_dir, key, values, mmap_mode='r', columns=None):
+    """ загрузить из колоночного хранилища только строки, где столбец key принимает значения values.
+    Поиск идет бинарным поиском по индексу столбца key(см. build_index), столбцы
+    открываются через memory-map и в память читаются только найденные строки
+
+    Parameters
+    ----------
+    store_dir: string
+        каталог хранилища
+    key: string
+        столбец по которому ищутся строки(например user_id)
+    values: array-like
+        искомые значения, отсутствующие в хранилище пропускаются
+    mmap_mode: string
+        режим memory-map для np.load
+    columns: list of string
+        загружаемые столбцы, по умолчанию все
+
+    Returns
+    -------
+        pandas.DataFrame найденных строк в порядке values
+    """
+    meta = _read_meta_or_raise(store_dir)
+    sorted_keys, order = build_index(store_dir, key, meta)
+
+    values = np.asarray(values)
+    pos = np.searchsorted(sorted_keys, values)
+    found = pos < len(sorted_keys)
+    found[found] = sorted_keys[pos[found]] == values[found]
+    rows = order[pos[found]]
+
+    data = {}
+    for col_meta in _select_columns(meta, columns):
+        col_values = np.load(os.path.join(store_dir, col_meta['file']), mmap_mode=mmap_mode)[rows]
+        data[col_meta['name']] = _decode_column(col_values, col_meta)
+    return pd.DataFrame(data, columns=list(data))
+
+
+def build_index(store_dir, key, meta=None):
+    """ индекс столбца key хранилища: отсортированные значения и номера их строк.
+    Строится один раз и пересобирается, если изменились данные хранилища
+
+    Returns
+    -------
+        (отсортированные значения, номера строк) - массивы, открытые через memory-map
+    """
+    if meta is None:
+        meta = read_meta(store_dir)
+    index_meta_fname = os.path.join(store_dir, f'index_{key}.json')
+    sorted_fname = os.path.join(store_dir, f'index_{key}_values.npy')
+    order_fname = os.path.join(store_dir, f'index_{key}_rows.npy')
+    index_meta = read_meta_file(index_meta_fname)
+    if index_meta is None or index_meta != {'fingerprint': meta['fingerprint'], 'n_rows': meta['n_rows']}:
+        col_meta = next(col_meta for col_meta in meta['columns'] if col_meta['name'] == key)
+        keys = np.load(os.path.join(store_dir, col_meta['file']), mmap_mode='r')
+        order = np.argsort(keys, kind='mergesort')
+        np.save(sorted_fname, keys[order])
+        np.save(order_fname, order)
+        with open(index_meta_fname + '.tmp', 'w') as f:
+            json.dump({'fingerprint': meta['fingerprint'], 'n_rows': meta['n_rows']}, f)
+        os.replace(index_meta_fname + '.tmp', index_meta_fname)
+    return np.load(sorted_fname, mmap_mode='r'), np.load(order_fname, mmap_mode='r')
+
+
+def _read_meta_or_raise(store_dir):
+    meta = read_meta(store_dir)
+    if meta is None:
+        raise FileNotFoundError(f'нет колоночного хранилища в {store_dir}')
+    return meta
+
+
+def _select_columns(meta, columns):
+    """ метаданные столбцов хранилища в порядке columns(None - все столбцы) """
+    if columns is None:
+        return meta['columns']
+    by_name = {col_meta['name']: col_meta for col_meta in meta['columns']}
+    missing = [col for col in columns if col not in by_name]
+    if missing:
+        raise KeyError(f'нет столбцов {missing} в хранилище')
+    return [by_name[col] for col in columns]
+
+
+def _decode_column(values, col_meta):
+    """ значения столбца хранилища: коды категориальных и строковых столбцов переводятся в значения """
+    if col_meta['kind'] == 'values':
+        return values
+    values = pd.Categorical.from_codes(values, col_meta['categories'], ordered=col_meta.get('ordered', False))
+    if col_meta['kind'] == 'object':
+        values = np.asarray(values, dtype=object)
+    return values
+
+
+def default_store_dir(fname):
+    """ каталог хранилища csv по умолчанию: conf.STORE_DIR/<имя файла с расширением> """
+    return os.path.join(conf.STORE_DIR, os.path.basename(fname))
+
+
+def read_csv_cached(fname, store_dir=None, dtype=None, categories=None, **read_csv_kwargs):
+    """ прочитать csv через колоночный кэш. При первом чтении(или изменении исходного файла)
+    csv разбирается pandas и сохраняется в хранилище, дальше грузится из .npy столбцов без разбора csv
+
+    Parameters
+    ----------
+    fname: string
+        путь до csv(может быть запакован)
+    store_dir: string
+        каталог хранилища, по умолчанию conf.STORE_DIR/<имя файла с расширением>
+    dtype: dict
+        типы столбцов
+    categories: dict
+        столбец -> список допустимых значений, столбец сохраняется как категориальный
+    read_csv_kwargs:
+        дополнительные параметры pd.read_csv
+    """
+    if store_dir is None:
+        store_dir = default_store_dir(fname)
+
+    fingerprint = file_fingerprint(fname)
+    meta = read_meta(store_dir)
+    if meta is not None and meta['fingerprint'] == fingerprint:
+        return load_frame(store_dir)
+    return _build_store(fname, store_dir, fingerprint, dtype, categories, **read_csv_kwargs)
+
+
+def ensure_store(fname, store_dir=None, dtype=None, categories=None, **read_csv_kwargs):
+    """ колоночное хранилище csv без загрузки данных: пересобирается, только если отпечаток
+    файла не совпадает с сохраненным(параметры как в read_csv_cached)
+
+    Returns
+    -------
+        каталог хранилища(для load_rows, load_columns)
+    """
+    if store_dir is None:
+        store_dir = default_store_dir(fname)
+
+    fingerprint = file_fingerprint(fname)
+    meta = read_meta(store_dir)
+    if meta is None or meta['fingerprint'] != fingerprint:
+        _build_store(fname, store_dir, fingerprint, dtype, categories, **read_csv_kwargs)
+    return store_dir
+
+
+def _build_store(fname, store_dir, fingerprint, dtype, categories, **read_csv_kwargs):
+    """ разобрать csv и сохранить в хранилище, возвращает разобранный датафрейм """
+    df = pd.read_csv(fname, dtype=dtype, **read_csv_kwargs)
+    for col, col_categories in (categories or {}).items():
+        values = pd.Categorical(df[col], categories=list(col_categories))
+        unknown = df[col][values.isna() & df[col].notna()].unique()
+        if len(unknown):
+            raise ValueError(f'неизвестные значения {unknown} в столбце {col}')
+        df[col] = values
+    save_frame(df, store_dir, fingerprint)
+    return df
+
+
+def load_events(fname=None):
+    """ загрузить действия пользователей со степами(по умолчанию обучающие)
+
+    Parameters
+    ----------
+    fname: string
+        путь до zip архива с данными
+    """
+    if fname is None:
+        fname = train_events_fname()
+    return read_csv_cached(fname, dtype=EVENTS_DTYPES, categories=EVENTS_CATEGORIES)
+
+
+def load_submissions(fname=None):
+    """ загрузить сабмиты практики(по умолчанию обучающие)
+
+    Parameters
+    ----------
+    fname: string
+        путь до zip архива с данными
+    """
+    if fname is None:
+        fname = train_submissions_fname()
+    return read_csv_cached(fname, dtype=SUBMISSIONS_DTYPES, categories=SUBMISSIONS_CATEGORIES)
+
+
+def train_events_fname():
+    return f'{conf.DATA_DIR}/event_data_train.zip'
+
+
+def train_submissions_fname():
+    return f'{conf.DATA_DIR}/submissions_data_train.zip'
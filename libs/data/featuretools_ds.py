@@ -1,10 +1,19 @@
+import hashlib
+import os
+import pickle
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import featuretools as ft
+import numpy as np
 import pandas as pd
 from featuretools import variable_types as vtypes
 
 import libs.data_helpers as dh
 import libs.utils.df_utils as dfu
-from libs.config import DATA_PERIOD_DAYS
+from libs.config import DATA_PERIOD_DAYS, N_JOBS, PROCESSED_DATA_DIR
+from libs.data.event_store import load_frame, read_meta, save_frame
 
 # описание атрибутов сущности события пользователя по курсу( это обучающие данные)
 events_vtypes = {'step_id': vtypes.Id,
@@ -56,10 +65,11 @@ course_vtypes = {
 }
 
 
-def prepare_ft(events, submissions, hb_course_df, n_users_sample=None):
-    """ подготовить данные и создать представление сущностей и связей """
+def prepare_ft(events, submissions, hb_course_df, n_users_sample=None, low_memory=False, features=None):
+    """ подготовить данные и создать представление сущностей и связей(low_memory, features см. create_es) """
     interactions = dh.create_interaction(events, submissions)
-    interactions = dh.preprocess_timestamp_cols(interactions)
+    # день не нужен, поэтому не строим столбец из datetime.date
+    interactions = dh.preprocess_timestamp_cols(interactions, day_as_int=True)
     dfu.safe_drop_cols_df(interactions, ['day', 'timestamp'])
 
     # сделаем случайную подвыборку пользователей для которых будем
@@ -71,24 +81,48 @@ def prepare_ft(events, submissions, hb_course_df, n_users_sample=None):
                         .reindex())
 
     # формируем сущности для featurestools
-    es = create_es(interactions, hb_course_df)
+    es = create_es(interactions, hb_course_df, low_memory, features)
     cut_off_time = create_cut_off_time(interactions, es, user_rand)
     return es, cut_off_time
 
 
-def create_es(interactions_train, course_df):
-    """ создание представления сущностей для featuretools """
+def create_es(interactions_train, course_df, low_memory=False, features=None):
+    """ создание представления сущностей для featuretools
+
+    Parameters
+    ----------
+    interactions_train: pandas.DataFrame
+        взаимодействия пользователей(см. prepare_ft)
+    course_df: pandas.DataFrame
+        информация о степах(hb_course_info.csv)
+    low_memory: bool
+        экономный режим: в сущности попадают только нужные столбцы в компактных типах
+        (int32 id, категории action и step_block.name) без лишних копий исходных таблиц
+    features: list of string
+        названия нужных признаков, в экономном режиме из курса остаются только
+        используемые ими столбцы(по умолчанию все)
+    """
+    if low_memory:
+        interactions_train = compact_interactions(interactions_train)
+        course_df = compact_course(course_df, features)
+    else:
+        # step_id из колоночного хранилища(event_store) int32, featuretools связывает сущности
+        # только по столбцам одного типа
+        interactions_train = interactions_train.astype({'step_id': course_df.step_id.dtype})
+        course_df = course_df.copy()
+
     es = ft.EntitySet('user_events')
     es = es.entity_from_dataframe(entity_id="events",
-                                  dataframe=interactions_train.copy(),
+                                  dataframe=interactions_train,
                                   make_index=True,
                                   index='id',
                                   time_index='date',
                                   variable_types=events_vtypes)
     es = es.entity_from_dataframe(entity_id="steps",
-                                  dataframe=course_df.copy(),
+                                  dataframe=course_df,
                                   index='step_id',
-                                  variable_types=course_vtypes)
+                                  variable_types={col: vtype for col, vtype in course_vtypes.items()
+                                                  if col in course_df.columns})
 
     es.normalize_entity('events', 'users', 'user_id', make_time_index=False);
     es = es.add_relationship(ft.Relationship(es['steps']['step_id'], es['events']['step_id']))
@@ -98,12 +132,14 @@ def create_es(interactions_train, course_df):
                                    'lesson_viewed_by', 'lesson_vote_delta',
                                    'section_id', 'section_position', 'section_title']
     es.normalize_entity('steps', 'lessons', 'lesson_id',
-                        additional_variables=lesson_additional_variables,
+                        additional_variables=[col for col in lesson_additional_variables
+                                              if col in course_df.columns],
                         make_time_index=False);
 
     sections_additional_variables = ['section_position', 'section_title']
     es.normalize_entity('lessons', 'sections', 'section_id',
-                        additional_variables=sections_additional_variables,
+                        additional_variables=[col for col in sections_additional_variables
+                                              if col in course_df.columns],
                         make_time_index=False);
 
     es["events"]["action"].interesting_values = interactions_train.action.unique().categories
@@ -112,6 +148,33 @@ def create_es(interactions_train, course_df):
     return es
 
 
+def compact_interactions(interactions):
+    """ только используемые featuretools столбцы взаимодействий в компактных типах.
+    Строится новая таблица из сконвертированных столбцов, без копии исходной целиком """
+    action = interactions.action
+    if not pd.api.types.is_categorical_dtype(action):
+        action = action.astype('category')
+    return pd.DataFrame({'step_id': interactions.step_id.values.astype(np.int32),
+                         'user_id': interactions.user_id.values.astype(np.int32),
+                         'action': action.values,
+                         'date': interactions.date.values})
+
+
+def compact_course(course_df, features=None):
+    """ столбцы курса, используемые признаками features(и нужные для связей сущностей),
+    step_block.name как категория, step_id int32 как в compact_interactions(featuretools
+    связывает сущности только по столбцам одного типа) """
+    keep_cols = ['step_id', 'lesson_id', 'section_id', 'step_block.name']
+    if features is None:
+        keep_cols = list(course_df.columns)
+    else:
+        keep_cols += [col for col in course_df.columns
+                      if any(re.search(rf'\.{re.escape(col)}[ ),]', feature) for feature in features)]
+    course_df = course_df[[col for col in course_df.columns if col in keep_cols]]
+    return course_df.assign(**{'step_id': course_df.step_id.values.astype(np.int32),
+                               'step_block.name': course_df['step_block.name'].astype('category')})
+
+
 def create_cut_off_time(interactions_train, es, user_rand=None, day_offset=DATA_PERIOD_DAYS):
     """ создать порог отсечения для каждого пользователя. 
     featurestools будет отбрасывать все события после этой даты(для каждого пользователя своя) """
@@ -125,30 +188,51 @@ def create_cut_off_time(interactions_train, es, user_rand=None, day_offset=DATA_
     return cut_off_time
 
 
-def create_features(es, cut_off_time, chunk_size=.05, n_jobs=3):
-    """ создание признаков  """
-    agg_primitives = [
-        'num_unique', 'count', 'percent_true',
-        'avg_time_between', 'time_since_first', 'time_since_last',
-        'trend', 'last', 'mean', 'min', 'max', 'std', 'mode', 'skew',
-        'median', 'num_unique', 'sum',
-    ]
-    trans_primitives = [
-        'is_weekend',
-        'days_since', 'time_since', 'time_since_previous', 'day',
-        'weekday', 'month'
-    ]
-    where_primitives = [
-        "count", 'percent_true', 'mean',
-        "count", "avg_time_between", 'time_since_first',
-        'time_since_last', 'percent_true', 'trend',
-    ]
+AGG_PRIMITIVES = [
+    'num_unique', 'count', 'percent_true',
+    'avg_time_between', 'time_since_first', 'time_since_last',
+    'trend', 'last', 'mean', 'min', 'max', 'std', 'mode', 'skew',
+    'median', 'num_unique', 'sum',
+]
+TRANS_PRIMITIVES = [
+    'is_weekend',
+    'days_since', 'time_since', 'time_since_previous', 'day',
+    'weekday', 'month'
+]
+WHERE_PRIMITIVES = [
+    "count", 'percent_true', 'mean',
+    "count", "avg_time_between", 'time_since_first',
+    'time_since_last', 'percent_true', 'trend',
+]
+
+
+def create_features(es, cut_off_time, chunk_size=.05, n_jobs=3, features=None):
+    """ создание признаков
+
+    Parameters
+    ----------
+    features: list of string
+        названия нужных признаков(например featuretools_x.get_ft_feature_names()).
+        Если переданы - считаются только они по сохраненным определениям(см. get_feature_defs),
+        иначе все признаки dfs
+    """
+    if features is not None:
+        feature_defs = get_feature_defs(es, features)
+        feature_matrix = ft.calculate_feature_matrix(
+            feature_defs,
+            entityset=es,
+            cutoff_time=cut_off_time,
+            n_jobs=n_jobs, chunk_size=chunk_size,
+            approximate="6 hour",
+            verbose=True)
+        return feature_matrix, feature_defs
+
     feature_matrix, feature_defs = ft.dfs(
         entityset=es,
         target_entity='users',
-        agg_primitives=agg_primitives,
-        trans_primitives=trans_primitives,
-        where_primitives=where_primitives,
+        agg_primitives=AGG_PRIMITIVES,
+        trans_primitives=TRANS_PRIMITIVES,
+        where_primitives=WHERE_PRIMITIVES,
         max_depth=3,
         cutoff_time=cut_off_time,
         features_only=False,
@@ -156,3 +240,151 @@ def create_features(es, cut_off_time, chunk_size=.05, n_jobs=3):
         approximate="6 hour",
         verbose=True)
     return feature_matrix, feature_defs
+
+
+def get_feature_defs(es, features, fname=None):
+    """ определения признаков featuretools по их названиям.
+    Определения сохраняются в файл, dfs(только перебор определений, без расчета)
+    запускается, если файла нет или в нем не хватает нужных признаков
+
+    Parameters
+    ----------
+    es: featuretools.EntitySet
+        сущности(см. create_es)
+    features: list of string
+        названия нужных признаков
+    fname: string
+        путь до файла с определениями
+    """
+    if fname is None:
+        fname = feature_defs_fname()
+    feature_defs = ft.load_features(fname) if os.path.exists(fname) else []
+    defs_by_name = {feature_def.get_name(): feature_def for feature_def in feature_defs}
+
+    if not set(features) <= set(defs_by_name):
+        feature_defs = ft.dfs(
+            entityset=es,
+            target_entity='users',
+            agg_primitives=AGG_PRIMITIVES,
+            trans_primitives=TRANS_PRIMITIVES,
+            where_primitives=WHERE_PRIMITIVES,
+            max_depth=3,
+            features_only=True)
+        defs_by_name = {feature_def.get_name(): feature_def for feature_def in feature_defs}
+        missing = set(features) - set(defs_by_name)
+        if missing:
+            raise ValueError(f'dfs не строит признаки: {sorted(missing)}')
+        ft.save_features([defs_by_name[feature] for feature in features], fname)
+    return [defs_by_name[feature] for feature in features]
+
+
+def create_features_sharded(es, cut_off_time, features, out_dir, n_shards=16, n_jobs=N_JOBS, chunk_size=.05):
+    """ расчет признаков по шардам пользователей в пуле процессов с сохранением каждого шарда.
+    Каждый шард считается ft.calculate_feature_matrix по сохраненным определениям(см. get_feature_defs)
+    и сразу пишется на диск, при повторном запуске готовые шарды не пересчитываются, если не изменились
+    признаки, данные сущностей и пороги отсечения шарда
+
+    Parameters
+    ----------
+    es: featuretools.EntitySet
+        сущности(см. create_es), сохраняются в out_dir и загружаются каждым процессом один раз
+    cut_off_time: pandas.DataFrame
+        пороги отсечения пользователей(см. create_cut_off_time)
+    features: list of string
+        названия нужных признаков
+    out_dir: string
+        каталог для готовых шардов
+    n_shards: int
+        колво шардов, память процесса ограничена размером матрицы одного шарда
+    n_jobs: int
+        колво процессов
+    chunk_size: float or int
+        chunk_size для ft.calculate_feature_matrix внутри шарда
+
+    Returns
+    -------
+        (pandas.DataFrame признаков с индексом user_id,
+         pandas.DataFrame времени расчета шардов: shard, n_users, seconds, resumed)
+    """
+    defs_fname = feature_defs_fname()
+    get_feature_defs(es, features, defs_fname)
+    features_hash = hashlib.sha1('\n'.join(features).encode()).hexdigest()[:16]
+    # признаки по агрегатам степов(steps.COUNT(events) и т.п.) зависят от взаимодействий всех пользователей,
+    # поэтому в отпечаток шарда входят все взаимодействия(события и сабмиты) и степы, а не только строки шарда
+    data_hash = '/'.join(dfu.df_fingerprint(es[entity_id].df) for entity_id in ('events', 'steps'))
+
+    shards, timings = [], []
+    for i, shard in enumerate(dfu.split_df_by_key(cut_off_time, 'user_id', n_shards)):
+        if not len(shard):
+            continue
+        shard_dir = os.path.join(out_dir, f'shard_{i}')
+        fingerprint = f'{features_hash}/{data_hash}/{dfu.df_fingerprint(shard)}'
+        meta = read_meta(shard_dir)
+        if meta is not None and meta['fingerprint'] == fingerprint:
+            timings.append({'shard': i, 'n_users': len(shard), 'seconds': 0., 'resumed': True})
+        else:
+            shards.append((i, shard, shard_dir, fingerprint))
+
+    if shards:
+        # сущности пишутся на диск один раз, процесс пула загружает их при первом своем шарде
+        # (initializer у ProcessPoolExecutor есть только с python 3.7)
+        os.makedirs(out_dir, exist_ok=True)
+        es_fname = os.path.join(out_dir, 'entityset.pkl')
+        with open(es_fname, 'wb') as f:
+            pickle.dump(es, f, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            with ProcessPoolExecutor(n_jobs) as pool:
+                futures = {pool.submit(_calc_features_shard, shard, chunk_size, es_fname, defs_fname, tuple(features)):
+                           (i, shard, shard_dir, fingerprint)
+                           for i, shard, shard_dir, fingerprint in shards}
+                failed = {}
+                for future in as_completed(futures):
+                    i, shard, shard_dir, fingerprint = futures[future]
+                    # упавший шард не мешает сохранить остальные, они не пересчитываются при повторном запуске
+                    if future.exception() is not None:
+                        failed[i] = future.exception()
+                        continue
+                    feature_matrix, seconds = future.result()
+                    save_frame(feature_matrix.reset_index(), shard_dir, fingerprint)
+                    timings.append({'shard': i, 'n_users': len(shard), 'seconds': seconds, 'resumed': False})
+        finally:
+            os.remove(es_fname)
+        if failed:
+            raise RuntimeError(f'не посчитаны шарды {sorted(failed)}') from next(iter(failed.values()))
+
+    timings = pd.DataFrame(timings, columns=['shard', 'n_users', 'seconds', 'resumed']).sort_values('shard')
+    feature_matrix = pd.concat([load_frame(os.path.join(out_dir, f'shard_{i}'), mmap_mode=None)
+                                for i in timings.shard])
+    feature_matrix = feature_matrix.set_index('user_id').sort_index()
+    return feature_matrix[features], timings.reset_index(drop=True)
+
+
+# сущности и определения признаков процесса пула create_features_sharded, загружаются при первом шарде
+_shard_worker = {}
+
+
+def _load_shard_worker(es_fname, defs_fname, features):
+    key = (es_fname, os.path.getmtime(es_fname), defs_fname, features)
+    if _shard_worker.get('key') != key:
+        with open(es_fname, 'rb') as f:
+            es = pickle.load(f)
+        defs_by_name = {feature_def.get_name(): feature_def for feature_def in ft.load_features(defs_fname)}
+        _shard_worker.update(key=key, es=es, feature_defs=[defs_by_name[feature] for feature in features])
+    return _shard_worker['es'], _shard_worker['feature_defs']
+
+
+def _calc_features_shard(cut_off_time, chunk_size, es_fname, defs_fname, features):
+    start = time.perf_counter()
+    es, feature_defs = _load_shard_worker(es_fname, defs_fname, features)
+    feature_matrix = ft.calculate_feature_matrix(
+        feature_defs,
+        entityset=es,
+        cutoff_time=cut_off_time,
+        n_jobs=1, chunk_size=chunk_size,
+        approximate="6 hour")
+    feature_matrix.index.name = 'user_id'
+    return feature_matrix, time.perf_counter() - start
+
+
+def feature_defs_fname():
+    return f"{PROCESSED_DATA_DIR}/ft_feature_defs.json"
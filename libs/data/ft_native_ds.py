@@ -0,0 +1,213 @@
+""" Признаки featuretools(см. featuretools_ds.create_features) первого уровня без featuretools.
+
+Считаются агрегаты по событиям пользователя до его порога отсечения(первое взаимодействие
+плюс n_day дней, как в featuretools_ds.create_cut_off_time), в том числе по атрибутам
+степов из hb_course_info.csv и с условием WHERE:
+    COUNT(events WHERE action = correct)
+    AVG_TIME_BETWEEN(events.date WHERE steps.step_block.name = text)
+    TIME_SINCE_LAST(events.date)
+    MEAN(events.steps.step_correct_ratio WHERE action = passed)
+    MEAN(events.DAYS_SINCE(date) WHERE action = viewed)
+    SUM(events.time_since_previous_by_user_id)
+Признаки второго уровня(агрегаты по степам, например MEAN(events.steps.COUNT(events))),
+TREND и MODE зависят от событий других пользователей и считаются только через featuretools.
+
+Все признаки считаются сразу по всем пользователям через np.bincount и groupby по номеру
+пользователя. Время в секундах, DAYS_SINCE - целые дни, как в featuretools.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from libs.config import DATA_PERIOD_DAYS
+from libs.data.ts_native_ds import skewness
+
+SECONDS_IN_DAY = 60 * 60 * 24
+
+FEATURE_RE = re.compile(r'^(?P<primitive>[A-Z_]+)\((?P<column>\S+?)'
+                        r'(?: WHERE (?P<where_column>\S+) = (?P<where_value>.+))?\)$')
+TIME_PRIMITIVES = ('AVG_TIME_BETWEEN', 'TIME_SINCE_FIRST', 'TIME_SINCE_LAST')
+VALUE_PRIMITIVES = ('NUM_UNIQUE', 'MEAN', 'SUM', 'MIN', 'MAX', 'STD', 'SKEW', 'MEDIAN', 'PERCENT_TRUE')
+# значения агрегатов для пользователей без подходящих событий(как default_value примитивов featuretools)
+ZERO_DEFAULT_PRIMITIVES = ('COUNT', 'SUM', 'PERCENT_TRUE')
+
+
+def gen_ft_features(interactions, course_df, features, n_day=DATA_PERIOD_DAYS):
+    """ посчитать признаки featuretools по их названиям
+
+    Parameters
+    ----------
+    interactions: pandas.DataFrame
+        взаимодействия пользователей со степами(см. data_helpers.create_interaction)
+    course_df: pandas.DataFrame
+        информация о степах(hb_course_info.csv)
+    features: list of string
+        названия признаков, все должны поддерживаться(см. is_supported)
+    n_day: int
+        колво первых дней активности пользователя по которым строятся признаки
+
+    Returns
+    -------
+        pandas.DataFrame с индексом user_id(отсортирован), столбцы в порядке features
+    """
+    specs = {feature: parse_feature(feature, course_df) for feature in features}
+    unsupported = [feature for feature, spec in specs.items() if spec is None]
+    if unsupported:
+        raise ValueError(f'признаки не поддерживаются: {unsupported}')
+
+    events = _EventsTable(interactions, course_df, n_day)
+    return pd.DataFrame({feature: events.calc(*specs[feature]) for feature in features},
+                        index=pd.Index(events.user_ids, name='user_id'), columns=list(features))
+
+
+def is_supported(feature, course_df):
+    """ считается ли признак gen_ft_features """
+    return parse_feature(feature, course_df) is not None
+
+
+def parse_feature(feature, course_df):
+    """ разобрать название признака featuretools
+
+    Returns
+    -------
+        (примитив, столбец, столбец условия, значение условия) или None, если признак не поддерживается
+    """
+    match = FEATURE_RE.match(feature)
+    if match is None:
+        return None
+    primitive, column = match.group('primitive'), _event_column(match.group('column'), course_df)
+    where_column, where_value = match.group('where_column'), match.group('where_value')
+    if where_column is not None:
+        where_column = _event_column(f'events.{where_column}', course_df)
+        if where_column is None:
+            return None
+
+    if primitive == 'COUNT' and column == 'events':
+        return primitive, column, where_column, where_value
+    if primitive in TIME_PRIMITIVES and column == 'date':
+        return primitive, column, where_column, where_value
+    if primitive in VALUE_PRIMITIVES and column not in (None, 'events', 'date'):
+        return primitive, column, where_column, where_value
+    return None
+
+
+def _event_column(column, course_df):
+    """ столбец события по пути featuretools: events.action -> action, events.steps.lessons.x -> x """
+    if column == 'events':
+        return column
+    if column in ('events.date', 'events.action', 'events.step_id', 'events.DAYS_SINCE(date)',
+                  'events.time_since_previous_by_user_id'):
+        return column[len('events.'):]
+    for prefix in ('events.steps.lessons.', 'events.steps.'):
+        if column.startswith(prefix) and column[len(prefix):] in course_df.columns:
+            return 'steps.' + column[len(prefix):]
+    return None
+
+
+class _EventsTable:
+    """ события до порога отсечения, отсортированные по пользователю и времени """
+
+    def __init__(self, interactions, course_df, n_day):
+        interactions = interactions.sort_values(['user_id', 'timestamp'], kind='mergesort')
+        first_ts = interactions.groupby('user_id')['timestamp'].transform('min').values
+        interactions = interactions[interactions.timestamp.values <= first_ts + n_day * SECONDS_IN_DAY]
+
+        self.user_ids, self.codes = np.unique(interactions.user_id.values, return_inverse=True)
+        self.n_users = len(self.user_ids)
+        self.timestamp = interactions.timestamp.values.astype(np.float64)
+        first_ts = _group_reduce(np.minimum, self.timestamp, self.codes, self.n_users)
+        self.cutoff = first_ts + n_day * SECONDS_IN_DAY
+        self.action = interactions.action.astype(str).values
+        self.step_id = interactions.step_id.values
+        self.course = course_df.set_index('step_id').reindex(self.step_id)
+        # значения столбцов условий WHERE, разобранные в коды один раз на столбец
+        self._where_codes = {}
+
+    def column(self, column):
+        if column == 'date':
+            return self.timestamp
+        if column == 'action':
+            return self.action
+        if column == 'step_id':
+            return self.step_id
+        if column == 'DAYS_SINCE(date)':
+            return np.floor((self.cutoff[self.codes] - self.timestamp) / SECONDS_IN_DAY)
+        if column == 'time_since_previous_by_user_id':
+            previous = np.r_[np.nan, self.timestamp[:-1]]
+            previous[np.r_[True, self.codes[1:] != self.codes[:-1]]] = np.nan
+            return self.timestamp - previous
+        return self.course[column[len('steps.'):]].values
+
+    def calc(self, primitive, column, where_column, where_value):
+        mask = np.ones(len(self.codes), dtype=bool)
+        if where_column is not None:
+            mask = self._where_mask(where_column, where_value)
+        codes = self.codes[mask]
+        n_rows = np.bincount(codes, minlength=self.n_users)
+
+        if primitive == 'COUNT':
+            return n_rows.astype(np.float64)
+        values = self.column(column)[mask]
+        if primitive == 'NUM_UNIQUE':
+            pairs = pd.DataFrame({'code': codes, 'value': values}).dropna().drop_duplicates()
+            result = np.bincount(pairs.code.values, minlength=self.n_users).astype(np.float64)
+        elif primitive in TIME_PRIMITIVES:
+            result = self._calc_time(primitive, values, codes, n_rows)
+        else:
+            result = self._calc_values(primitive, values.astype(np.float64), codes, n_rows)
+
+        if primitive not in ZERO_DEFAULT_PRIMITIVES:
+            result[n_rows == 0] = np.nan
+        return result
+
+    def _where_mask(self, where_column, where_value):
+        if where_column not in self._where_codes:
+            self._where_codes[where_column] = pd.factorize(pd.Series(self.column(where_column)).astype(str))
+        codes, values = self._where_codes[where_column]
+        return codes == values.get_loc(where_value) if where_value in values else np.zeros(len(codes), dtype=bool)
+
+    def _calc_time(self, primitive, timestamp, codes, n_rows):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if primitive == 'AVG_TIME_BETWEEN':
+                time_range = (_group_reduce(np.maximum, timestamp, codes, self.n_users)
+                              - _group_reduce(np.minimum, timestamp, codes, self.n_users))
+                return np.where(n_rows < 2, np.nan, time_range / (n_rows - 1))
+        if primitive == 'TIME_SINCE_FIRST':
+            return self.cutoff - _group_reduce(np.minimum, timestamp, codes, self.n_users)
+        return self.cutoff - _group_reduce(np.maximum, timestamp, codes, self.n_users)
+
+    def _calc_values(self, primitive, values, codes, n_rows):
+        valid = ~np.isnan(values)
+        if primitive == 'PERCENT_TRUE':
+            n_true = np.bincount(codes, weights=valid & (np.nan_to_num(values) != 0), minlength=self.n_users)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.where(n_rows == 0, 0., n_true / n_rows)
+        if primitive in ('MIN', 'MAX', 'MEDIAN'):
+            grouped = pd.Series(values).groupby(codes)
+            result = getattr(grouped, primitive.lower())()
+            return result.reindex(np.arange(self.n_users)).values
+
+        n_valid = np.bincount(codes, weights=valid, minlength=self.n_users)
+        values_sum = np.bincount(codes, weights=np.where(valid, values, 0.), minlength=self.n_users)
+        if primitive == 'SUM':
+            return values_sum
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = values_sum / n_valid
+            if primitive == 'MEAN':
+                return mean
+            centered = np.where(valid, values - mean[codes], 0.)
+            m2 = np.bincount(codes, weights=centered ** 2, minlength=self.n_users)
+            if primitive == 'STD':
+                return np.where(n_valid < 2, np.nan, np.sqrt(m2 / (n_valid - 1)))
+            m3 = np.bincount(codes, weights=centered ** 3, minlength=self.n_users)
+            return skewness(m2, m3, n_valid)
+
+
+def _group_reduce(ufunc, values, codes, n_groups):
+    """ ufunc.reduceat по группам отсортированного массива codes, для пустых групп NaN """
+    result = np.full(n_groups, np.nan)
+    if len(codes):
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        result[codes[starts]] = ufunc.reduceat(values, starts)
+    return result
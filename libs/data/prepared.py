@@ -0,0 +1,93 @@
+import numpy as np
+
+import libs.config as conf
+import libs.data_helpers as dh
+
+
+class PreparedData:
+    """ Общие подготовленные данные для генераторов признаков одного запуска пайплайна.
+
+    Все таблицы считаются лениво при первом обращении и запоминаются, поэтому
+    объединение, сортировка и разбор времени выполняются один раз, сколько бы
+    генераторов признаков их не использовали.
+
+    Parameters
+    ----------
+    events: pandas.DataFrame
+        действия студентов со степами
+    submissions: pandas.DataFrame
+        действия студентов по практике
+    n_day: int
+        колво первых дней активности пользователя по которым строятся признаки, по умолчанию conf.DATA_PERIOD_DAYS
+    course_threshold : int
+        порог в колве заданий, когда курс считается пройденным
+    target_action: string
+        название действия по степу, по колву которых рассчитывается целевая переменная
+    day_as_int: bool
+        столбец day как целый номер дня, а не python datetime.date(см. preprocess_timestamp_cols)
+    """
+
+    def __init__(self, events, submissions, n_day=None, course_threshold=40,
+                 target_action='correct', day_as_int=True):
+        self.raw_events = events
+        self.raw_submissions = submissions
+        self.n_day = conf.DATA_PERIOD_DAYS if n_day is None else n_day
+        self.course_threshold = course_threshold
+        self.target_action = target_action
+        self.day_as_int = day_as_int
+        self._cache = {}
+
+    def cache_params(self):
+        """ параметры подготовки данных, от которых зависят признаки и метка(входят в ключ feature_cache) """
+        return self.n_day, self.course_threshold, self.target_action, self.day_as_int
+
+    def _memo(self, name, calc):
+        if name not in self._cache:
+            self._cache[name] = calc()
+        return self._cache[name]
+
+    @property
+    def events(self):
+        """ действия пользователей с разобранным временем """
+        return self._memo('events', lambda: dh.preprocess_timestamp_cols(self.raw_events, self.day_as_int))
+
+    @property
+    def submissions(self):
+        """ сабмиты пользователей с разобранным временем """
+        return self._memo('submissions',
+                          lambda: dh.preprocess_timestamp_cols(self.raw_submissions, self.day_as_int))
+
+    @property
+    def events_nday(self):
+        """ действия за первые n_day дней(отсчет от первого действия пользователя) """
+        return self._memo('events_nday', lambda: dh.truncate_data_by_nday(self.events, self.n_day))
+
+    @property
+    def submissions_nday(self):
+        """ сабмиты за первые n_day дней(отсчет от первого сабмита пользователя) """
+        return self._memo('submissions_nday', lambda: dh.truncate_data_by_nday(self.submissions, self.n_day))
+
+    @property
+    def interactions(self):
+        """ все взаимодействия, отсортированные по пользователю и времени """
+        return self._memo('interactions', lambda: dh.create_interaction(self.events, self.submissions))
+
+    @property
+    def interactions_nday(self):
+        """ взаимодействия за первые n_day дней(отсчет от первого взаимодействия пользователя) """
+        return self._memo('interactions_nday',
+                          lambda: dh.truncate_data_by_nday(self.interactions, self.n_day))
+
+    @property
+    def user_ids(self):
+        """ отсортированные id всех пользователей из events и submissions """
+        return self._memo('user_ids', lambda: np.unique(np.concatenate((self.raw_events.user_id.unique(),
+                                                                        self.raw_submissions.user_id.unique()))))
+
+    @property
+    def y(self):
+        """ метка is_gone по всем данным пользователя """
+        return self._memo('y', self._calc_y)
+
+    def _calc_y(self):
+        return dh.get_y(self.raw_events, self.raw_submissions, self.course_threshold, self.target_action)
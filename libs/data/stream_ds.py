@@ -0,0 +1,119 @@
+""" Потоковое построение признаков по пользователям для логов, которые не помещаются в память.
+
+Исходные csv читаются кусками и раскладываются по файлам-партициям по хэшу user_id,
+поэтому все события одного пользователя оказываются в одной партиции.
+Дальше признаки считаются по каждой партиции отдельно и объединяются.
+"""
+import os
+import tempfile
+
+import pandas as pd
+
+import libs.config as conf
+import libs.features.step_progress as fsp
+import libs.utils.df_utils as dfu
+from libs import data_iter1 as di1
+from libs.data.event_store import EVENTS_COLUMNS, EVENTS_DTYPES, SUBMISSIONS_COLUMNS, SUBMISSIONS_DTYPES
+from libs.data.prepared import PreparedData
+
+
+def partition_csv_by_user(fname, out_dir, n_parts, chunksize=10 ** 6, dtype=None):
+    """ разложить csv по n_parts файлам по хэшу user_id, читая исходный файл кусками
+
+    Parameters
+    ----------
+    fname: string
+        путь до csv(может быть запакован)
+    out_dir: string
+        каталог для файлов-партиций
+    n_parts: int
+        колво партиций
+    chunksize: int
+        колво строк, читаемых за раз
+    dtype: dict
+        типы столбцов
+
+    Returns
+    -------
+        list of string - пути до партиций(файла может не быть, если в партицию ничего не попало)
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    part_fnames = [os.path.join(out_dir, f'part_{i}.csv') for i in range(n_parts)]
+    for part_fname in part_fnames:
+        if os.path.exists(part_fname):
+            os.remove(part_fname)
+
+    for chunk in pd.read_csv(fname, chunksize=chunksize, dtype=dtype):
+        for part_fname, part in zip(part_fnames, dfu.split_df_by_key(chunk, 'user_id', n_parts)):
+            if len(part):
+                part.to_csv(part_fname, mode='a', index=False, header=not os.path.exists(part_fname))
+    return part_fnames
+
+
+def iter_user_partitions(events_fname, submissions_fname, work_dir, n_parts=16, chunksize=10 ** 6):
+    """ генератор пар (events, submissions) по партициям пользователей
+
+    Parameters
+    ----------
+    events_fname: string
+        путь до csv с действиями пользователей
+    submissions_fname: string
+        путь до csv с сабмитами
+    work_dir: string
+        каталог для временных файлов-партиций
+    n_parts: int
+        колво партиций, память ограничена размером одной партиции
+    chunksize: int
+        колво строк, читаемых из исходных файлов за раз
+    """
+    events_parts = partition_csv_by_user(events_fname, os.path.join(work_dir, 'events'),
+                                         n_parts, chunksize, EVENTS_DTYPES)
+    submissions_parts = partition_csv_by_user(submissions_fname, os.path.join(work_dir, 'submissions'),
+                                              n_parts, chunksize, SUBMISSIONS_DTYPES)
+    for events_part, submissions_part in zip(events_parts, submissions_parts):
+        if not os.path.exists(events_part) and not os.path.exists(submissions_part):
+            continue
+        # в партиции могут быть только пользователи без событий(или без сабмитов)
+        yield (_read_part(events_part, EVENTS_COLUMNS, EVENTS_DTYPES),
+               _read_part(submissions_part, SUBMISSIONS_COLUMNS, SUBMISSIONS_DTYPES))
+
+
+def _read_part(part_fname, columns, dtype):
+    """ прочитать файл-партицию, пустой датафрейм с теми же типами если файла нет """
+    if os.path.exists(part_fname):
+        return pd.read_csv(part_fname, dtype=dtype)
+    return pd.DataFrame({col: pd.Series([], dtype=dtype.get(col, object)) for col in columns}, columns=columns)
+
+
+def calc_user_features(events, submissions, n_day=conf.DATA_PERIOD_DAYS):
+    """ признаки data_iter1 и признаки отношений step_progress по части пользователей """
+    prepared = PreparedData(events, submissions, n_day)
+    users_data = di1.get_x(events, submissions, prepared)
+    return pd.concat([users_data, fsp.gen_interact_features(users_data)], axis=1)
+
+
+def create_user_data_stream(events_fname, submissions_fname, n_parts=16, chunksize=10 ** 6,
+                            n_day=conf.DATA_PERIOD_DAYS, work_dir=None):
+    """ посчитать по партициям пользователей признаки data_iter1 и отношения step_progress
+
+    Parameters
+    ----------
+    events_fname: string
+        путь до csv с действиями пользователей
+    submissions_fname: string
+        путь до csv с сабмитами
+    n_parts: int
+        колво партиций, память ограничена размером одной партиции
+    chunksize: int
+        колво строк, читаемых из исходных файлов за раз
+    n_day: int
+        колво первых дней активности пользователя по которым строятся признаки
+    work_dir: string
+        каталог для файлов-партиций, по умолчанию временный(удаляется после расчета)
+    """
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        users_data = [calc_user_features(events, submissions, n_day)
+                      for events, submissions in iter_user_partitions(events_fname, submissions_fname,
+                                                                      tmp_dir, n_parts, chunksize)]
+    users_data = pd.concat(users_data)
+    return users_data.sort_index()
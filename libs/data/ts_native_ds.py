@@ -0,0 +1,189 @@
+""" Расчет признаков временных рядов tsfresh(см. tsfresh_ds.gen_fc_params) без tsfresh.
+
+Все ряды пользователей лежат одним массивом подряд(строки отсортированы по user_id и date),
+границы рядов задаются массивом смещений offsets, поэтому каждый признак считается сразу
+по всем пользователям и всем столбцам-действиям свертками по отрезкам(np.*.reduceat).
+Значения и названия столбцов совпадают с tsfresh.extract_features, включая граничные
+случаи(короткие ряды, нулевая дисперсия). Точки ряда упорядочены по date: tsfresh < 0.13
+на широком формате(столбец на действие) сортирует ряды не по их датам, поэтому autocorrelation
+и c3 из tsfresh_ds.gen_ts_features в этих версиях отличаются(tests/test_ts_native_ds.py
+сравнивает с длинным форматом).
+"""
+import numpy as np
+import pandas as pd
+
+AUTOCORRELATION_LAGS = tuple(range(10))
+C3_LAGS = (1, 2, 3)
+
+
+def prep_ts_interact(data):
+    """ подготовка данных, представляем действия пользователя как временной ряд """
+    interact_sub = data[['user_id', 'date', 'action']]
+    interact_sub['weight'] = interact_sub.action.cat.codes
+    interact_sub.action = interact_sub.action.astype('str')
+
+    ts_df = pd.pivot_table(interact_sub, index=['user_id', 'date'], columns='action',
+                           values='weight', aggfunc=np.max)
+    ts_df = ts_df.reset_index()
+    ts_df = ts_df.sort_values('user_id')
+    ts_df = ts_df.fillna(0)
+    return ts_df
+
+
+def gen_ts_features(ts_data, features=None):
+    """ сгенерировать датасет с признаками, как tsfresh_ds.gen_ts_features
+
+    Parameters
+    ----------
+    ts_data: pandas.DataFrame
+        временные ряды пользователей(см. prep_ts_interact): столбцы user_id, date
+        и по столбцу на каждое действие
+    features: list of string
+        названия нужных признаков(например data_iter_auto.get_ts_feature_names()),
+        считаются только нужные ряды и лаги. По умолчанию все признаки
+
+    Returns
+    -------
+        pandas.DataFrame с индексом user_id
+    """
+    kinds = sorted(col for col in ts_data.columns if col not in ('user_id', 'date'))
+    autocorrelation_lags, c3_lags = AUTOCORRELATION_LAGS, C3_LAGS
+    if features is not None:
+        kinds = sorted({feature.split('__')[0] for feature in features})
+        autocorrelation_lags = _feature_lags(features, 'autocorrelation')
+        c3_lags = _feature_lags(features, 'c3')
+
+    ts_data = ts_data.sort_values(['user_id', 'date'])
+    # действия, которых нет в данных(например в запросе по одному пользователю), - нулевые ряды, как после
+    # fillna(0) в prep_ts_interact у пользователей без этого действия
+    values = ts_data.reindex(columns=kinds, fill_value=0).values.astype(np.float64)
+    user_ids, offsets = segment_offsets(ts_data.user_id.values)
+
+    ts_features = {}
+    for name, feature in calc_segment_features(values, offsets, autocorrelation_lags, c3_lags).items():
+        for kind, kind_feature in zip(kinds, feature.T):
+            ts_features[f'{kind}__{name}'] = kind_feature
+    ts_features = pd.DataFrame(ts_features, index=pd.Index(user_ids, name='user_id'))
+    if features is None:
+        features = sorted(ts_features.columns)
+    return ts_features[list(features)]
+
+
+def segment_offsets(ids):
+    """ уникальные id отсортированного массива и смещения начала каждого отрезка(плюс конец массива) """
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    return ids[starts], np.r_[starts, len(ids)]
+
+
+def calc_segment_features(values, offsets, autocorrelation_lags=AUTOCORRELATION_LAGS, c3_lags=C3_LAGS):
+    """ признаки по отрезкам values[offsets[i]:offsets[i + 1]]
+
+    Parameters
+    ----------
+    values: numpy.ndarray
+        матрица строки x ряды, отрезки не пустые
+    offsets: numpy.ndarray
+        смещения начала отрезков и конец массива
+    autocorrelation_lags, c3_lags: list of int
+        лаги признаков autocorrelation и c3
+
+    Returns
+    -------
+        dict название признака -> матрица отрезки x ряды
+    """
+    starts = offsets[:-1]
+    length = np.diff(offsets).astype(np.float64)[:, np.newaxis]
+    segment = np.repeat(np.arange(len(starts)), np.diff(offsets))
+
+    mean = np.add.reduceat(values, starts, axis=0) / length
+    centered = values - mean[segment]
+    m2 = np.add.reduceat(centered ** 2, starts, axis=0)
+    m3 = np.add.reduceat(centered ** 3, starts, axis=0)
+    m4 = np.add.reduceat(centered ** 4, starts, axis=0)
+    variance = m2 / length
+
+    features = {
+        'length': np.broadcast_to(length, mean.shape).copy(),
+        'maximum': np.maximum.reduceat(values, starts, axis=0),
+        'mean': mean,
+        'median': _median(values, offsets, segment),
+        'minimum': np.minimum.reduceat(values, starts, axis=0),
+        'variance': variance,
+        'skewness': skewness(m2, m3, length),
+        'kurtosis': kurtosis(m2, m4, length),
+    }
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for lag in autocorrelation_lags:
+            lag_sum = _lag_reduce(centered * _shift(centered, lag), segment, lag, starts)
+            autocorrelation = lag_sum / ((length - lag) * variance)
+            autocorrelation[np.isclose(variance, 0) | (length <= lag)] = np.nan
+            features[f'autocorrelation__lag_{lag}'] = autocorrelation
+        for lag in c3_lags:
+            lag_sum = _lag_reduce(values * _shift(values, lag) * _shift(values, 2 * lag), segment, 2 * lag, starts)
+            features[f'c3__lag_{lag}'] = np.where(2 * lag >= length, 0., lag_sum / (length - 2 * lag))
+    return features
+
+
+def is_order_dependent(feature):
+    """ зависит ли признак kind__calculator__lag_N от порядка точек ряда(autocorrelation с лагом > 0, c3).
+    В файлах признаков, посчитанных tsfresh < 0.13, такие признаки отличаются от считаемых здесь """
+    calculator = feature.split('__')[1]
+    if calculator == 'c3':
+        return True
+    return calculator == 'autocorrelation' and int(feature.rsplit('_', 1)[1]) > 0
+
+
+def _feature_lags(features, calculator):
+    """ лаги calculator, встречающиеся в названиях признаков kind__calculator__lag_N """
+    return sorted({int(feature.rsplit('_', 1)[1]) for feature in features
+                   if feature.split('__')[1] == calculator})
+
+
+def _shift(values, lag):
+    """ values[i + lag] на месте i(хвост заполняется нулями) """
+    shifted = np.zeros_like(values)
+    shifted[:len(values) - lag] = values[lag:]
+    return shifted
+
+
+def _lag_reduce(products, segment, lag, starts):
+    """ сумма произведений по отрезкам, только для пар точек i, i + lag из одного отрезка """
+    same_segment = np.zeros(len(segment), dtype=bool)
+    same_segment[:len(segment) - lag] = segment[:len(segment) - lag] == segment[lag:]
+    return np.add.reduceat(np.where(same_segment[:, np.newaxis], products, 0.), starts, axis=0)
+
+
+def _median(values, offsets, segment):
+    """ медиана по отрезкам: сортировка внутри отрезков и среднее двух центральных элементов """
+    length = np.diff(offsets)
+    median = np.empty((len(length), values.shape[1]))
+    for i in range(values.shape[1]):
+        sorted_values = values[np.lexsort((values[:, i], segment)), i]
+        median[:, i] = (sorted_values[offsets[:-1] + (length - 1) // 2]
+                        + sorted_values[offsets[:-1] + length // 2]) / 2
+    return median
+
+
+def _zero_out_fperr(values):
+    """ как в pandas: моменты меньше 1e-14 считаются ошибкой округления """
+    return np.where(np.abs(values) < 1e-14, 0., values)
+
+
+def skewness(m2, m3, length):
+    """ несмещенный коэффициент асимметрии как pandas.Series.skew """
+    m2, m3 = _zero_out_fperr(m2), _zero_out_fperr(m3)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = (length * (length - 1) ** 0.5 / (length - 2)) * (m3 / m2 ** 1.5)
+    result = np.where(m2 == 0, 0., result)
+    return np.where(length < 3, np.nan, result)
+
+
+def kurtosis(m2, m4, length):
+    """ несмещенный коэффициент эксцесса как pandas.Series.kurtosis """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        adj = 3 * (length - 1) ** 2 / ((length - 2) * (length - 3))
+        numer = _zero_out_fperr(length * (length + 1) * (length - 1) * m4)
+        denom = _zero_out_fperr((length - 2) * (length - 3) * m2 ** 2)
+        result = numer / denom - adj
+    result = np.where(denom == 0, 0., result)
+    return np.where(length < 4, np.nan, result)
@@ -1,6 +1,8 @@
-import numpy as np
-import pandas as pd
 import tsfresh
+from tsfresh.feature_extraction.settings import from_columns
+
+# подготовка рядов не зависит от tsfresh и лежит в ts_native_ds, здесь для совместимости с ноутбуками
+from libs.data.ts_native_ds import prep_ts_interact  # noqa: F401
 
 
 def gen_fc_params():
@@ -13,32 +15,34 @@ def gen_fc_params():
     return final_params
 
 
-def prep_ts_interact(data):
-    """ подготовка данных, представляем действия пользователя как временной ряд """
-    interact_sub = data[['user_id', 'date', 'action']]
-    interact_sub['weight'] = interact_sub.action.cat.codes
-    interact_sub.action = interact_sub.action.astype('str')
-
-    ts_df = pd.pivot_table(interact_sub, index=['user_id', 'date'], columns='action',
-                           values='weight', aggfunc=np.max)
-    ts_df = ts_df.reset_index()
-    ts_df = ts_df.sort_values('user_id')
-    ts_df = ts_df.fillna(0)
-    return ts_df
-
+def gen_ts_features(ts_data, n_jobs=2, features=None):
+    """ сгенерировать датасет с рпизнаками
 
-def gen_ts_features(ts_data):
-    """ сгенерировать датасет с рпизнаками """
+    Parameters
+    ----------
+    ts_data: pandas.DataFrame
+        временные ряды пользователей(см. prep_ts_interact)
+    n_jobs: int
+        колво процессов tsfresh(свой пул tsfresh, не зависит от conf.N_JOBS)
+    features: list of string
+        названия нужных признаков(например data_iter_auto.get_ts_feature_names()),
+        tsfresh считает только их(нужные ряды и лаги). По умолчанию все признаки gen_fc_params
+    """
     TSF_PARAMS = {
         'chunksize': 5,
-        'n_jobs': 2,
-        'fc_params': gen_fc_params()
+        'n_jobs': n_jobs,
+        'fc_params': gen_fc_params(),
+        'kind_fc_params': None,
     }
+    if features is not None:
+        TSF_PARAMS['kind_fc_params'] = from_columns(features)
+        ts_data = ts_data[['user_id', 'date'] + sorted(TSF_PARAMS['kind_fc_params'])]
     tsf_df_test = tsfresh.extract_features(
         ts_data,
         column_id='user_id',
         column_sort='date',
         default_fc_parameters=TSF_PARAMS['fc_params'],
+        kind_to_fc_parameters=TSF_PARAMS['kind_fc_params'],
         chunksize=TSF_PARAMS['chunksize'],
         disable_progressbar=False,
         n_jobs=TSF_PARAMS['n_jobs'])
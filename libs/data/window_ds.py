@@ -0,0 +1,136 @@
+""" Датасеты для экспериментов с окном первых дней активности(n_day) и порогом метки.
+
+Признаки data_iter1 и отношения step_progress(как stream_ds.calc_user_features) строятся
+сразу для нескольких окон за один проход: взаимодействия один раз сортируются по пользователю
+и смещению от его первого действия(отдельно для событий и сабмитов, как truncate_data_by_nday),
+по отсортированным строкам считаются накопленные суммы счетчиков. Окно пользователя - префикс
+его строк, граница находится бинарным поиском, поэтому каждое окно стоит O(колво пользователей).
+Метки для нескольких порогов считаются одним вызовом data_helpers.get_labels.
+"""
+import numpy as np
+import pandas as pd
+
+import libs.config as conf
+import libs.data_helpers as dh
+import libs.features.step_progress as fsp
+from libs.data_iter1 import USER_DATA_COLUMNS
+from libs.utils.df_utils import compact_dtypes
+
+SECONDS_IN_DAY = 60 * 60 * 24
+
+
+def gen_window_datasets(events, submissions, n_days=(1, 2, 3, 7), course_thresholds=(40,),
+                        target_actions=('correct',)):
+    """ признаки для нескольких окон первых дней и метки для нескольких порогов
+
+    Parameters
+    ----------
+    events: pandas.DataFrame
+        действия студентов со степами
+    submissions: pandas.DataFrame
+        действия студентов по практике
+    n_days: list of int
+        размеры окон в днях(см. conf.DATA_PERIOD_DAYS)
+    course_thresholds: list of int
+        пороги в колве заданий, когда курс считается пройденным
+    target_actions: list of string
+        действия, по колву которых рассчитывается метка
+
+    Returns
+    -------
+        (dict n_day -> pandas.DataFrame признаков с индексом user_id,
+         pandas.DataFrame меток, см. data_helpers.get_labels)
+    """
+    counts = WindowCounts(events, submissions)
+    features = {n_day: counts.features(n_day) for n_day in n_days}
+    return features, dh.get_labels(events, submissions, course_thresholds, target_actions)
+
+
+class WindowCounts:
+    """ Накопленные счетчики USER_DATA_COLUMNS по строкам, отсортированным по пользователю и
+    смещению от первого действия пользователя
+
+    Parameters
+    ----------
+    events: pandas.DataFrame
+        действия студентов со степами
+    submissions: pandas.DataFrame
+        действия студентов по практике
+    """
+
+    def __init__(self, events, submissions):
+        self.user_ids, user_codes = np.unique(np.concatenate((events.user_id.values, submissions.user_id.values)),
+                                              return_inverse=True)
+        n_users = len(self.user_ids)
+        events_users, submissions_users = user_codes[:len(events)], user_codes[len(events):]
+        self.has_events = np.bincount(events_users, minlength=n_users) > 0
+        self.has_submissions = np.bincount(submissions_users, minlength=n_users) > 0
+
+        events_offset = _offset_from_first(events.timestamp.values, events_users)
+        submissions_offset = _offset_from_first(submissions.timestamp.values, submissions_users)
+        weights = np.concatenate((self._event_weights(events, events_users),
+                                  _kind_weights(submissions.submission_status, conf.SUBMISSION_STATUSES)))
+
+        users = np.concatenate((events_users, submissions_users))
+        offset = np.concatenate((events_offset, submissions_offset))
+        order = np.lexsort((offset, users))
+        self.span = int(offset.max()) + 1 if len(offset) else 1
+        self.keys = users[order].astype(np.int64) * self.span + offset[order]
+        # cum_counts[i] - суммы счетчиков по первым i отсортированным строкам
+        self.cum_counts = np.zeros((len(order) + 1, len(USER_DATA_COLUMNS)), dtype=np.int64)
+        np.cumsum(weights[order], axis=0, out=self.cum_counts[1:])
+        self.starts = np.searchsorted(self.keys, np.arange(n_users, dtype=np.int64) * self.span)
+
+    def user_data(self, n_day):
+        """ данные пользователей за первые n_day дней(как data_iter1.get_x) """
+        limit = min(n_day * SECONDS_IN_DAY, self.span - 1)
+        ends = np.searchsorted(self.keys, np.arange(len(self.user_ids), dtype=np.int64) * self.span + limit,
+                               side='right')
+        counts = self.cum_counts[ends] - self.cum_counts[self.starts]
+
+        users_data = pd.DataFrame(counts, index=pd.Index(self.user_ids, name='user_id'), columns=USER_DATA_COLUMNS)
+        # пропуски как в data_helpers.create_user_data_fast
+        if not self.has_submissions.all():
+            users_data[list(conf.SUBMISSION_STATUSES)] = users_data[list(conf.SUBMISSION_STATUSES)].astype(np.float64)
+        if not self.has_events.all():
+            event_cols = list(conf.ACTION_CATEGORIES) + ['day']
+            users_data[event_cols] = users_data[event_cols].astype(np.float64)
+            users_data.loc[~self.has_events, event_cols] = np.nan
+        if conf.COMPACT_DTYPES:
+            users_data = compact_dtypes(users_data)
+        return users_data
+
+    def features(self, n_day):
+        """ признаки data_iter1 и отношения step_progress за первые n_day дней(как stream_ds.calc_user_features) """
+        users_data = self.user_data(n_day)
+        return pd.concat([users_data, fsp.gen_interact_features(users_data)], axis=1)
+
+    @staticmethod
+    def _event_weights(events, events_users):
+        weights = _kind_weights(events.action, conf.ACTION_CATEGORIES)
+        # новый календарный день пользователя - в столбец day, сумма по окну дает колво разных дней
+        order = np.lexsort((events.timestamp.values, events_users))
+        days = events.timestamp.values[order] // SECONDS_IN_DAY
+        users = events_users[order]
+        new_day = np.ones(len(order), dtype=bool)
+        new_day[1:] = (users[1:] != users[:-1]) | (days[1:] != days[:-1])
+        weights[order, USER_DATA_COLUMNS.index('day')] = new_day
+        return weights
+
+
+def _kind_weights(values, kinds):
+    """ матрица строки x USER_DATA_COLUMNS с единицей в столбце значения(неизвестные значения не считаются) """
+    weights = np.zeros((len(values), len(USER_DATA_COLUMNS)), dtype=np.int32)
+    codes = pd.Categorical(values, categories=list(kinds)).codes
+    known = codes >= 0
+    columns = np.array([USER_DATA_COLUMNS.index(kind) for kind in kinds])
+    weights[np.flatnonzero(known), columns[codes[known]]] = 1
+    return weights
+
+
+def _offset_from_first(timestamp, users):
+    """ время от первого действия пользователя(по этим же строкам) """
+    if not len(timestamp):
+        return timestamp.astype(np.int64)
+    first = pd.Series(timestamp).groupby(users).transform('min').values
+    return (timestamp - first).astype(np.int64)
@@ -1,16 +1,26 @@
 import numpy as np
 import pandas as pd
 
+from libs.config import SUBMISSION_STATUSES
+from libs.utils import profiling
 
-def preprocess_timestamp_cols(data):
+
+def preprocess_timestamp_cols(data, day_as_int=False):
     """ 
     Parameters
     ----------
     data : pd.DataFrame
         данные с действиями пользователя
+    day_as_int : bool
+        день как целое число(номер дня от начала эпохи, timestamp // 86400) вместо
+        python datetime.date. Столбец из date объектов медленно строится, занимает много
+        памяти и медленно считается nunique/pivot
     """
     data['date'] = pd.to_datetime(data.timestamp, unit='s')
-    data['day'] = data.date.dt.date
+    if day_as_int:
+        data['day'] = data.timestamp.values // (60 * 60 * 24)
+    else:
+        data['day'] = data.date.dt.date
     return data
 
 
@@ -38,10 +48,15 @@ def create_user_data(events, submissions):
     Parameters
     ----------
     events : pd.DataFrame
-        данные с действиями пользователя
+        данные с действиями пользователя, столбец day может быть как datetime.date, так и целым номером дня
     submissions : pd.DataFrame
         данные самбитов практики
     """
+    # категориальные столбцы(например из колоночного хранилища) приводим к строкам,
+    # чтобы состав и порядок столбцов сводных таблиц не зависел от способа загрузки данных
+    events = events.assign(action=events.action.astype(str))
+    submissions = submissions.assign(submission_status=submissions.submission_status.astype(str))
+
     users_data = events.groupby('user_id', as_index=False) \
         .agg({'timestamp': 'max'}).rename(columns={'timestamp': 'last_timestamp'})
 
@@ -69,6 +84,85 @@ def create_user_data(events, submissions):
     return users_data
 
 
+def create_user_data_fast(events, submissions):
+    """ создать таблицу с данными по каждому пользователю(то же что create_user_data).
+    Пользователи, события и статусы кодируются целыми числами, все счетчики по таблице
+    считаются одним np.bincount, дни на курсе - как уникальные номера дней(timestamp // 86400)
+
+    Parameters
+    ----------
+    events : pd.DataFrame
+        данные с действиями пользователя
+    submissions : pd.DataFrame
+        данные самбитов практики
+    """
+    user_ids, user_codes = np.unique(np.concatenate((events.user_id.values, submissions.user_id.values)),
+                                     return_inverse=True)
+    n_users = len(user_ids)
+    events_users, submissions_users = user_codes[:len(events)], user_codes[len(events):]
+    has_events = np.bincount(events_users, minlength=n_users) > 0
+    has_submissions = np.bincount(submissions_users, minlength=n_users) > 0
+
+    users_data = pd.DataFrame({'user_id': user_ids})
+    last_timestamp = (pd.Series(events.timestamp.values).groupby(events_users).max()
+                      .reindex(np.arange(n_users), fill_value=0).values)
+    # совместимость с create_user_data: там после outer merge появлялись NaN и столбцы становились float
+    users_data['last_timestamp'] = last_timestamp if has_events.all() else last_timestamp.astype(np.float64)
+
+    # попытки сдачи практики пользователя
+    status_counts, statuses = _count_by_user(submissions_users, submissions.submission_status, n_users)
+    for i, status in enumerate(statuses):
+        counts = status_counts[:, i]
+        users_data[status] = counts if has_submissions.all() else counts.astype(np.float64)
+
+    # колво разных событий пользователя по урокам, у пользователей без событий NaN
+    action_counts, actions = _count_by_user(events_users, events.action, n_users)
+    for i, action in enumerate(actions):
+        users_data[action] = _nan_if_missing(action_counts[:, i], has_events)
+
+    # колво дней на курсе
+    if 'day' in events and pd.api.types.is_integer_dtype(events.day):
+        days = events.day.values
+    else:
+        days = events.timestamp.values // (60 * 60 * 24)
+    users_days = np.bincount(_unique_pairs_first(events_users, days), minlength=n_users)
+    users_data['day'] = _nan_if_missing(users_days, has_events)
+
+    return users_data
+
+
+def _count_by_user(users_codes, values, n_users):
+    """ матрица колва значений values по пользователям(n_users x колво разных values).
+    Значения упорядочены по названию, как столбцы pivot_table """
+    values_codes, names = pd.factorize(values, sort=True)
+    names = np.asarray(names).astype(str)
+    order = np.argsort(names)
+    remap = np.empty(len(names), dtype=np.int64)
+    remap[order] = np.arange(len(names))
+
+    known = values_codes >= 0
+    counts = np.bincount(users_codes[known] * len(names) + remap[values_codes[known]],
+                         minlength=n_users * len(names))
+    return counts.reshape(n_users, len(names)), list(names[order])
+
+
+def _unique_pairs_first(first, second):
+    """ первые элементы уникальных пар (first, second) целых чисел """
+    if not len(first):
+        return first
+    second = second - second.min()
+    span = second.max() + 1
+    return np.unique(first.astype(np.int64) * span + second) // span
+
+
+def _nan_if_missing(counts, has_data):
+    if has_data.all():
+        return counts
+    counts = counts.astype(np.float64)
+    counts[~has_data] = np.nan
+    return counts
+
+
 def get_y(events, submissions, course_threshold=40, target_action='correct'):
     """ создать метку  (целевая переменная для прогноза is_gone
 
@@ -83,27 +177,60 @@ def get_y(events, submissions, course_threshold=40, target_action='correct'):
     target_action: string
         название действия по степу, по колву которых мы рассчитываем целевую переменную 
     """
-    interactions = create_interaction(events, submissions)
-    users_data = interactions[['user_id']].drop_duplicates()
+    y = get_labels(events, submissions, [course_threshold], [target_action])[(target_action, course_threshold)]
+    assert y.shape[0] == events.user_id.nunique()
+    return y.rename('is_gone')
+
 
-    assert target_action in interactions.action.unique()
+def get_labels(events, submissions, course_thresholds=(40,), target_actions=('correct',)):
+    """ метки is_gone сразу для нескольких порогов и целевых действий(например для перебора порога).
+        Колво уникальных степов по каждому действию считается один раз, без объединения таблиц
 
-    # вместо count по хорошему нужно брать уникальные степы. Потому что correct может встречаться более 1 раза
-    passed_steps = (interactions.query("action == @target_action")
-                    .groupby('user_id', as_index=False)['step_id'].agg(lambda a: len(np.unique(a)))
-                    .rename(columns={'step_id': target_action}))
-    users_data = users_data.merge(passed_steps, how='outer')
+    Parameters
+    ----------
+    events : pd.DataFrame
+        данные с действиями пользователя
+    submissions : pd.DataFrame
+        данные самбитов практики
+    course_thresholds : list of int
+        пороги в колве заданий, когда курс считается пройденным
+    target_actions: list of string
+        действия по степу(статусы сабмитов или действия events), по колву которых рассчитывается метка
+
+    Returns
+    -------
+        pd.DataFrame с индексом user_id(отсортирован), столбцы - пары (target_action, course_threshold)
+    """
+    user_ids = np.union1d(events.user_id.unique(), submissions.user_id.unique())
+    course_thresholds = np.asarray(course_thresholds)
 
-    # пройден ли курс
-    users_data['is_gone'] = users_data[target_action] > course_threshold
-    assert users_data.user_id.nunique() == events.user_id.nunique()
-    users_data = (users_data.drop(target_action, axis=1)
-                  .set_index('user_id'))
-    return users_data['is_gone']
+    labels = []
+    for target_action in target_actions:
+        if target_action in SUBMISSION_STATUSES:
+            data, action_col = submissions, 'submission_status'
+        else:
+            data, action_col = events, 'action'
+        is_target = (data[action_col].astype(str) == target_action).values
+        assert is_target.any(), f'нет действий {target_action}'
+
+        # уникальные пары (пользователь, степ): correct может встречаться по степу более 1 раза
+        user_pos = np.searchsorted(user_ids, data.user_id.values[is_target]).astype(np.int64)
+        step_ids = data.step_id.values[is_target].astype(np.int64)
+        n_step_ids = step_ids.max() + 1
+        pairs = np.unique(user_pos * n_step_ids + step_ids)
+        n_steps = np.bincount(pairs // n_step_ids, minlength=len(user_ids))
+
+        # пройден ли курс
+        labels.append(n_steps[:, np.newaxis] > course_thresholds[np.newaxis, :])
+
+    columns = pd.MultiIndex.from_product([list(target_actions), course_thresholds.tolist()],
+                                         names=['target_action', 'course_threshold'])
+    return pd.DataFrame(np.hstack(labels), index=pd.Index(user_ids, name='user_id'), columns=columns)
 
 
 def truncate_data_by_nday(data, n_day):
-    """ Взять события из n_day первых дней по каждому пользователю 
+    """ Взять события из n_day первых дней по каждому пользователю.
+        Строки сохраняют исходный порядок и индекс
 
         Parameters
         ----------
@@ -112,16 +239,13 @@ def truncate_data_by_nday(data, n_day):
         n_day : int
             размер тестовой выборки
     """
-    users_min_time = data.groupby('user_id', as_index=False).agg({'timestamp': 'min'}).rename(
-        {'timestamp': 'min_timestamp'}, axis=1)
-    users_min_time['min_timestamp'] += 60 * 60 * 24 * n_day
-
-    events_data_d = pd.merge(data, users_min_time, how='inner', on='user_id')
-    cond = events_data_d['timestamp'] <= events_data_d['min_timestamp']
-    events_data_d = events_data_d[cond]
+    # минимальное время пользователя разворачиваем сразу на строки, без merge с копией всей таблицы
+    users_min_time = data.groupby('user_id')['timestamp'].transform('min')
+    cond = data['timestamp'].values <= users_min_time.values + 60 * 60 * 24 * n_day
+    events_data_d = data[cond]
 
     assert events_data_d.user_id.nunique() == data.user_id.nunique()
-    return events_data_d.drop(['min_timestamp'], axis=1)
+    return events_data_d
 
 
 def split_events_submissions(events, submissions, test_size=0.3):
@@ -160,9 +284,60 @@ def make_intersect_by_users(events, submissions, data):
     """ вернуть данные из data только  по тем пользователям, которые есть в events, submissions """
     user_ids = np.unique(np.concatenate((events.user_id.unique(),
                                          submissions.user_id.unique())))
+    return intersect_by_user_ids(user_ids, data)
+
 
+def intersect_by_user_ids(user_ids, data):
+    """ вернуть данные из data только по пользователям user_ids(в порядке user_ids) """
     # проверяем что для всех пользователей которых передали есть информация
     diff_users = np.setdiff1d(user_ids, data.index.values)
     assert len(diff_users) == 0
 
     return data.loc[user_ids]
+
+
+def assemble_features(user_ids, blocks, dtype=np.float64):
+    """ собрать матрицу признаков из блоков в один заранее выделенный массив без merge/concat.
+    Порядок пользователей задается один раз(user_ids), каждый блок пишет свои столбцы в срез массива
+
+    Parameters
+    ----------
+    user_ids: numpy.ndarray
+        id пользователей(строки результата)
+    blocks: list of (pandas.DataFrame, list of string)
+        признаки с индексом user_id и нужные из них столбцы(None - все). Если индекс блока совпадает
+        с user_ids, строки копируются как есть, иначе выбираются по индексу(например из таблиц
+        заранее посчитанных признаков по всем пользователям), все user_ids должны быть в блоке
+    dtype: numpy.dtype
+        тип значений матрицы
+
+    Returns
+    -------
+        pandas.DataFrame с индексом user_id поверх одного C-непрерывного массива
+    """
+    blocks = [(block, list(block.columns) if block_columns is None else list(block_columns))
+              for block, block_columns in blocks]
+    columns = [col for _, block_columns in blocks for col in block_columns]
+    values = np.empty((len(user_ids), len(columns)), dtype=dtype)
+
+    start = 0
+    for block, block_columns in blocks:
+        rows = _block_rows(user_ids, block.index)
+        for i, col in enumerate(block_columns):
+            col_values = block[col].values
+            values[:, start + i] = col_values if rows is None else col_values[rows]
+        start += len(block_columns)
+    return pd.DataFrame(values, index=pd.Index(user_ids, name='user_id'), columns=columns)
+
+
+def _block_rows(user_ids, index):
+    """ номера строк блока по user_ids, None если блок уже выровнен по user_ids """
+    if len(index) == len(user_ids) and np.array_equal(index.values, user_ids):
+        return None
+    rows = index.get_indexer(user_ids)
+    if (rows < 0).any():
+        raise ValueError(f'в блоке признаков нет пользователей {np.asarray(user_ids)[rows < 0][:10]}')
+    return rows
+
+
+profiling.profile_module(__name__)
@@ -1,9 +1,19 @@
+import numpy as np
+
 import libs.data_helpers as dh
-from libs.config import DATA_PERIOD_DAYS
-from libs.utils.df_utils import safe_drop_cols_df
+from libs import config as conf
+from libs.data.prepared import PreparedData
+from libs.utils import feature_cache, profiling
+from libs.utils.df_utils import compact_dtypes, safe_drop_cols_df
+
+# признаки пользователя: колво сабмитов по статусам, колво событий по типам и колво дней на курсе
+USER_DATA_COLUMNS = sorted(conf.SUBMISSION_STATUSES) + sorted(conf.ACTION_CATEGORIES) + ['day']
+# версия кода признаков для кэша(поднимать при изменении признаков)
+FEATURES_VERSION = 2
 
 
-def get_x_y(events, submissions):
+@feature_cache.cached('data_iter1', FEATURES_VERSION)
+def get_x_y(events, submissions, prepared=None):
     """" создадим признаки и метку
      
     Parameters
@@ -12,21 +22,50 @@ def get_x_y(events, submissions):
         действия студентов со степами
     submissions: pandas.DataFrame
         действия студентов по практике     
+    prepared: libs.data.prepared.PreparedData
+        общие подготовленные данные запуска, если не передать - будут созданы по events, submissions
      """
-    events_train = dh.preprocess_timestamp_cols(events)
-    events_train = dh.truncate_data_by_nday(events_train, DATA_PERIOD_DAYS)
-
-    submissions_train = dh.preprocess_timestamp_cols(submissions)
-    submissions_train = dh.truncate_data_by_nday(submissions_train, DATA_PERIOD_DAYS)
-
-    X = dh.create_user_data(events_train, submissions_train)
-    X = X.set_index('user_id')
-    safe_drop_cols_df(X, ['last_timestamp'])
+    if prepared is None:
+        prepared = PreparedData(events, submissions)
 
-    y = dh.get_y(events, submissions, 40, 'correct')
+    X = get_x(events, submissions, prepared)
+    y = prepared.y
 
     # после создания признаков и метки порядок следования user_id может не совпадать
-    X = X.sort_index()
     y = y.sort_index()
     assert X.shape[0] == y.shape[0]
     return X, y
+
+
+def get_x(events, submissions, prepared=None):
+    """" создадим признаки без метки(отсортированы по user_id)
+
+    Parameters
+    ----------
+    events: pandas.DataFrame
+        действия студентов со степами
+    submissions: pandas.DataFrame
+        действия студентов по практике
+    prepared: libs.data.prepared.PreparedData
+        общие подготовленные данные запуска, если не передать - будут созданы по events, submissions
+     """
+    if prepared is None:
+        prepared = PreparedData(events, submissions)
+
+    X = dh.create_user_data_fast(prepared.events_nday, prepared.submissions_nday)
+    X = X.set_index('user_id')
+    safe_drop_cols_df(X, ['last_timestamp'])
+    # состав столбцов не должен зависеть от того, какие события встретились в данных(например в части пользователей)
+    missing_actions = [col for col in conf.ACTION_CATEGORIES if col not in X]
+    X = X.reindex(columns=USER_DATA_COLUMNS, fill_value=0)
+    # у пользователей без событий(day NaN) счетчики действий NaN, как в create_user_data_fast
+    no_events = X['day'].isna().values
+    if missing_actions and no_events.any():
+        X[missing_actions] = X[missing_actions].astype(np.float64)
+        X.loc[no_events, missing_actions] = np.nan
+    if conf.COMPACT_DTYPES:
+        X = compact_dtypes(X)
+    return X.sort_index()
+
+
+profiling.profile_module(__name__)
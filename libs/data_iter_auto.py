@@ -1,30 +1,78 @@
 import numpy as np
 
+import libs.config as conf
 import libs.data_helpers as dh
-from libs.features.featuretools_x import load_calc_ft_features
-from libs.features.tsfresh_x import load_cache_ts_features
+from libs.data.prepared import PreparedData
+from libs.features.featuretools_x import ft_features_fingerprint, get_ft_feature_names, load_calc_ft_features
+from libs.features.tsfresh_x import load_cache_ts_features, ts_features_fingerprint
+from libs.utils import feature_cache, profiling
+from libs.utils.df_utils import compact_dtypes
 
+# версия кода признаков для кэша(поднимать при изменении признаков)
+FEATURES_VERSION = 1
 
-def get_x_y(events, submissions):
-    y = dh.get_y(events, submissions, 40, 'correct')
+
+def features_files_fingerprint():
+    """ отпечаток файлов признаков tsfresh и featuretools, из которых читаются признаки """
+    return f'{ts_features_fingerprint()}|{ft_features_fingerprint()}'
+
+
+@feature_cache.cached('data_iter_auto', FEATURES_VERSION, depends=features_files_fingerprint)
+def get_x_y(events, submissions, prepared=None):
+    if prepared is None:
+        prepared = PreparedData(events, submissions)
+    X = get_x(events, submissions, prepared)
+    y = prepared.y
+
+    # после создания признаков и метки порядок следования user_id может не совпадать
+    y = y.sort_index()
+    assert X.shape[0] == y.shape[0]
+    return X, y
+
+
+def get_x(events, submissions, prepared=None, ts_data=None, steps_matrix=None):
+    """ признаки без метки(отсортированы по user_id)
+
+    Parameters
+    ----------
+    events: pandas.DataFrame
+        действия студентов со степами
+    submissions: pandas.DataFrame
+        действия студентов по практике
+    prepared: libs.data.prepared.PreparedData
+        общие подготовленные данные запуска, если не передать - будут созданы по events, submissions
+    ts_data: pandas.DataFrame
+        признаки tsfresh по всем пользователям, если не передать - будут загружены из файлов
+    steps_matrix: pandas.DataFrame
+        признаки featuretools по всем пользователям, если не передать - будут загружены из файлов
+        (без файлов - посчитаны по данным, см. featuretools_x.load_calc_ft_features)
+    """
+    if prepared is None:
+        prepared = PreparedData(events, submissions)
 
     # признаки по временным рядам сгенерированы с помощью tsfresh
-    ts_data = load_cache_ts_features()
-    X = dh.make_intersect_by_users(events, submissions, ts_data)
+    if ts_data is None:
+        ts_data = load_cache_ts_features()
+    X = dh.intersect_by_user_ids(prepared.user_ids, ts_data)
 
     # признаки сгенеренные featuretools
-    steps_matrix = load_calc_ft_features()
-    steps_matrix = dh.make_intersect_by_users(events, submissions, steps_matrix)
+    if steps_matrix is None:
+        ft_features = [col for col in get_list_important_features() if col in get_ft_feature_names()]
+        steps_matrix = load_calc_ft_features(prepared.interactions, prepared.n_day, features=ft_features)
+    steps_matrix = dh.intersect_by_user_ids(prepared.user_ids, steps_matrix)
     X = X.merge(steps_matrix, how='left', left_index=True, right_index=True, validate='1:1')
 
     # оставим только важные признаки (отбор c помощью boruta)
     X = X[get_list_important_features()]
+    if conf.COMPACT_DTYPES:
+        X = compact_dtypes(X)
+    return X.sort_index()
 
-    # после создания признаков и метки порядок следования user_id может не совпадать
-    X = X.sort_index()
-    y = y.sort_index()
-    assert X.shape[0] == y.shape[0]
-    return X, y
+
+def get_ts_feature_names():
+    """ названия важных признаков tsfresh(вида kind__calculator__lag_N) для генерации только их
+    (см. tsfresh_ds.gen_ts_features, ts_native_ds.gen_ts_features) """
+    return [feature for feature in get_list_important_features() if '__' in feature]
 
 
 def get_list_important_features():
@@ -345,3 +393,6 @@ def get_list_important_features():
                      'TREND(events.time_since_previous_by_step_id, date WHERE steps.step_block.name = text)',
                      'TREND(events.time_since_previous_by_user_id, date WHERE action = correct)',
                      'TREND(events.time_since_previous_by_user_id, date WHERE steps.step_block.name = text)'])
+
+
+profiling.profile_module(__name__)
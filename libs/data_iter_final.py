@@ -1,34 +1,145 @@
-import pandas as pd
+from functools import partial
 
+import numpy as np
+
+import libs.config as conf
 import libs.data_helpers as dh
 import libs.features.step_progress as fsp
 from libs import data_iter1 as di1
 from libs import data_iter_auto as di_auto
-from libs.features.step_weight import gen_user_step_scores
+from libs.data.prepared import PreparedData
+from libs.features.featuretools_x import get_ft_feature_names, load_calc_ft_features, load_ft_features
+from libs.features.step_weight import (gen_user_step_scores, get_steps_weight, load_steps_weight,
+                                       steps_weight_fingerprint)
+from libs.features.tsfresh_x import load_cache_ts_features, load_ts_features
+from libs.utils import feature_cache, profiling
+from libs.utils.df_utils import to_matrix
+from libs.utils.parallel import map_user_shards
 
+#  Отбирал важныепризнаки с помощью boruta
+SCORE_STEP_IDS = [31971, 31972, 31976, 31977, 31978, 32031, 32173, 32174,
+                  32175, 32177, 32219, 32812, 32815, 32929, 32950]
+# версия кода признаков для кэша(поднимать при изменении признаков)
+FEATURES_VERSION = 2
 
-def get_x_y(events, submissions):
-    X, y = di_auto.get_x_y(events, submissions)
 
-    # полуручные признаки по степам (взаимодействие одних событий с другими
-    x_iter1, _ = di1.get_x_y(events, submissions)
-    func_gen_features = (fsp.gen_progress_features, fsp.create_ratio_features_action,
-                         fsp.create_ratio_features_action_subm_status, fsp.create_ratio_features_day)
-    interact_features = [gen_fun(x_iter1) for gen_fun in func_gen_features]
-    interact_features = pd.concat(interact_features, axis=1)
-    interact_features = interact_features.fillna(0)
-    X = pd.concat([X, interact_features], axis=1)
-
-    # признаки сгенеренные featuretools
-    user_step_scores = gen_user_step_scores(events, submissions)
-    user_step_scores = dh.make_intersect_by_users(events, submissions, user_step_scores)
-    #  Отбирал важныепризнаки с помощью boruta
-    user_step_scores = user_step_scores[
-        ['score_31971', 'score_31972', 'score_31976', 'score_31977',
-         'score_31978', 'score_32031', 'score_32173', 'score_32174',
-         'score_32175', 'score_32177', 'score_32219', 'score_32812',
-         'score_32815', 'score_32929', 'score_32950']]
-    X = X.merge(user_step_scores, how='left', left_index=True, right_index=True, validate='1:1')
+def get_x_y(events, submissions, n_jobs=conf.N_JOBS, refresh_steps_weight=False):
+    """ признаки и метка финальной модели, отсортированы по user_id
+
+    Parameters
+    ----------
+    events: pandas.DataFrame
+        действия студентов со степами
+    submissions: pandas.DataFrame
+        действия студентов по практике
+    n_jobs: int
+        колво процессов для расчета признаков по шардам пользователей
+    refresh_steps_weight: bool
+        пересобрать общий индекс весов степов по этим данным, если он построен по другим
+        (см. step_weight.get_steps_weight). Нужно только при обучении, иначе веса берутся из индекса
+        (он строится по этим данным, только если его нет или он устарел)
+    """
+    # объединение, сортировка и разбор времени общие для всех генераторов признаков
+    prepared = PreparedData(events, submissions)
+    # индекс весов строится до расчета ключа кэша, чтобы ключ учитывал актуальный индекс
+    get_steps_weight(prepared, refresh=refresh_steps_weight)
+    return _get_x_y(events, submissions, n_jobs, prepared)
+
+
+def _inputs_fingerprint():
+    # признаки зависят от файлов tsfresh и featuretools и от индекса весов степов
+    return f'{di_auto.features_files_fingerprint()}|{steps_weight_fingerprint()}'
+
+
+@feature_cache.cached('data_iter_final', FEATURES_VERSION, depends=_inputs_fingerprint)
+def _get_x_y(events, submissions, n_jobs, prepared):
+    X = get_x(events, submissions, n_jobs, prepared)
+    y = prepared.y.sort_index()
 
     assert X.shape[0] == y.shape[0]
     return X, y
+
+
+def transform(events, submissions, n_jobs=conf.N_JOBS):
+    """ признаки для прогноза по новым пользователям(отсортированы по user_id): метка не считается,
+    из файлов признаков tsfresh и featuretools читаются только строки этих пользователей,
+    веса степов берутся посчитанные при обучении
+
+    Parameters
+    ----------
+    events: pandas.DataFrame
+        действия студентов со степами
+    submissions: pandas.DataFrame
+        действия студентов по практике
+    n_jobs: int
+        колво процессов для расчета признаков по шардам пользователей
+
+    Returns
+    -------
+        pandas.DataFrame, готовый для model.predict_proba
+    """
+    prepared = PreparedData(events, submissions)
+    return get_x(events, submissions, n_jobs, prepared, ts_data=load_ts_features(prepared.user_ids),
+                 steps_matrix=load_ft_features(prepared.user_ids), hard_steps_weight=load_steps_weight())
+
+
+def get_x(events, submissions, n_jobs=conf.N_JOBS, prepared=None, ts_data=None, steps_matrix=None,
+          hard_steps_weight=None):
+    """ признаки финальной модели без расчета метки(например для прогноза), отсортированы по user_id
+
+    Parameters
+    ----------
+    events: pandas.DataFrame
+        действия студентов со степами
+    submissions: pandas.DataFrame
+        действия студентов по практике
+    n_jobs: int
+        колво процессов для расчета признаков по шардам пользователей
+    prepared: libs.data.prepared.PreparedData
+        общие подготовленные данные запуска, если не передать - будут созданы по events, submissions
+    ts_data, steps_matrix: pandas.DataFrame
+        заранее загруженные признаки tsfresh и featuretools(см. data_iter_auto.get_x)
+    hard_steps_weight: pandas.Series
+        заранее загруженные веса степов(см. step_weight.get_steps_weight)
+    """
+    if prepared is None:
+        prepared = PreparedData(events, submissions)
+    # признаки по пользователям независимы, поэтому при n_jobs > 1 считаем их по шардам пользователей(map_user_shards)
+    # признаки по временным рядам(tsfresh) и сгенеренные featuretools, только важные(см. data_iter_auto.get_x)
+    if ts_data is None:
+        ts_data = load_cache_ts_features()
+    important_features = di_auto.get_list_important_features()
+    ts_columns = [col for col in important_features if col in ts_data.columns]
+    if steps_matrix is None:
+        # без файлов featuretools признаки считаются по данным(см. featuretools_x.load_calc_ft_features)
+        ft_features = [col for col in important_features if col in get_ft_feature_names() and col not in ts_columns]
+        steps_matrix = load_calc_ft_features(prepared.interactions, prepared.n_day, features=ft_features)
+    ft_columns = [col for col in important_features if col in steps_matrix.columns and col not in ts_data.columns]
+
+    # полуручные признаки по степам (взаимодействие одних событий с другими
+    interact_features = map_user_shards(gen_interact_features, prepared, n_jobs,
+                                        tables=('events_nday', 'submissions_nday'))
+
+    # баллы пользователей за степы
+    if hard_steps_weight is None:
+        hard_steps_weight = get_steps_weight(prepared)
+    gen_scores = partial(gen_user_step_scores, hard_steps_weight=hard_steps_weight, step_ids=SCORE_STEP_IDS)
+    user_step_scores = map_user_shards(gen_scores, prepared, n_jobs, tables=('interactions_nday',))
+
+    # все блоки пишутся в одну матрицу в порядке prepared.user_ids(отсортированы)
+    blocks = [(ts_data, ts_columns), (steps_matrix, ft_columns), (interact_features, None), (user_step_scores, None)]
+    return dh.assemble_features(prepared.user_ids, blocks, np.float32 if conf.COMPACT_DTYPES else np.float64)
+
+
+def model_matrix(X):
+    """ матрица признаков для модели: C-непрерывная, float32 при conf.COMPACT_DTYPES(RandomForest
+    sklearn обучается на float32, поэтому такая матрица передается в деревья без копирования) """
+    return to_matrix(X, np.float32 if conf.COMPACT_DTYPES else np.float64)
+
+
+def gen_interact_features(events, submissions, prepared=None):
+    """ признаки отношений(step_progress) по данным пользователя data_iter1 """
+    return fsp.gen_interact_features(di1.get_x(events, submissions, prepared))
+
+
+profiling.profile_module(__name__)
@@ -1,28 +1,137 @@
+import os
+
 import numpy  as np
 import pandas as pd
 
 import libs.config as conf
+from libs.data import ft_native_ds
+from libs.data.event_store import ensure_store, file_fingerprint, load_rows, read_csv_cached
+from libs.utils import profiling
+from libs.utils.df_utils import compact_dtypes
+
+
+def load_calc_ft_features(interactions=None, n_day=conf.DATA_PERIOD_DAYS, course_df=None, features=None):
+    """ признаки featuretools из сгенерированных файлов(ft_features_fnames). Если файлов нет -
+    считаются по interactions без featuretools(см. calc_native_ft_features), тогда все признаки
+    features должны поддерживаться ft_native_ds, иначе ошибка со списком неподдерживаемых
+
+    Parameters
+    ----------
+    interactions: pandas.DataFrame
+        все взаимодействия пользователей(см. data_helpers.create_interaction), нужны только без файлов
+    n_day: int
+        колво первых дней активности пользователя по которым строятся признаки(расчет без файлов)
+    course_df: pandas.DataFrame
+        информация о степах(hb_course_info.csv), по умолчанию читается из conf.DATA_DIR
+    features: list of string
+        нужные признаки, по умолчанию все важные(get_ft_feature_names)
+
+    Returns
+    -------
+        pandas.DataFrame с индексом user_id
+    """
+    if features is None:
+        features = get_ft_feature_names()
+    missing_fnames = [fname for fname in ft_features_fnames() if not os.path.exists(fname)]
+    if not missing_fnames:
+        steps_matrix = pd.concat([read_csv_cached(fname, compression='zip')[['user_id'] + list(features)]
+                                  for fname in ft_features_fnames()])
+        return _prep_ft_features(steps_matrix)
+
+    if interactions is None:
+        raise FileNotFoundError(f'нет файлов признаков featuretools {missing_fnames}, '
+                                f'для расчета без featuretools нужны interactions')
+    if course_df is None:
+        course_df = pd.read_csv(f"{conf.DATA_DIR}/hb_course_info.csv")
+    unsupported = [feature for feature in features if not ft_native_ds.is_supported(feature, course_df)]
+    if unsupported:
+        raise NotImplementedError(f'нет файлов признаков featuretools {missing_fnames}, а {len(unsupported)} '
+                                  f'признаков без featuretools не считаются(см. unsupported_ft_feature_names): '
+                                  f'{unsupported}')
+    return calc_native_ft_features(interactions, features, n_day, course_df)
+
+
+def load_ft_features(user_ids):
+    """ признаки featuretools только по пользователям user_ids(через индекс по user_id в колоночном
+    хранилище), обработаны как в load_calc_ft_features
+
+    Parameters
+    ----------
+    user_ids: numpy.ndarray
+        id пользователей, пользователи без признаков пропускаются
+    """
+    columns = list(get_importance_features_ft())
+    steps_matrix = [load_rows(ensure_store(fname, compression='zip'), 'user_id', user_ids, columns=columns)
+                    for fname in ft_features_fnames()]
+    return _prep_ft_features(pd.concat(steps_matrix))
+
+
+def ft_features_fingerprint():
+    """ отпечаток файлов признаков featuretools(для ключа кэша признаков), без файлов признаки
+    считаются по данным(см. load_calc_ft_features) и от файлов не зависят """
+    return '/'.join(file_fingerprint(fname) if os.path.exists(fname) else 'native' for fname in ft_features_fnames())
+
+
+def ft_features_fnames():
+    """ файлы сгенерированных признаков featuretools по обучающим и тестовым пользователям """
+    return [f'{conf.PROCESSED_DATA_DIR}/step_features_train_ft3.csv.zip',
+            f'{conf.PROCESSED_DATA_DIR}/step_features_submit_ft3.csv.zip']
 
 
-def load_calc_ft_features():
-    steps_matrix_train = pd.read_csv(f'{conf.PROCESSED_DATA_DIR}/step_features_train_ft3.csv.zip',
-                                     compression='zip')
-    steps_matrix_train = steps_matrix_train[get_importance_features_ft()]
-    steps_matrix_submit = pd.read_csv(f'{conf.PROCESSED_DATA_DIR}/step_features_submit_ft3.csv.zip',
-                                      compression='zip')
-    steps_matrix_submit = steps_matrix_submit[get_importance_features_ft()]
-    steps_matrix = pd.concat([steps_matrix_train, steps_matrix_submit])
+def _prep_ft_features(steps_matrix):
     steps_matrix = steps_matrix.select_dtypes(exclude='object')
     steps_matrix = steps_matrix.fillna(-1)
     bool2int(steps_matrix)
     steps_matrix = steps_matrix.set_index('user_id')
+    if conf.COMPACT_DTYPES:
+        steps_matrix = compact_dtypes(steps_matrix)
     return steps_matrix
 
 
+def calc_native_ft_features(interactions, features, n_day=conf.DATA_PERIOD_DAYS, course_df=None):
+    """ признаки featuretools без featuretools(см. ft_native_ds), пропуски заполнены как в load_calc_ft_features
+
+    Parameters
+    ----------
+    interactions: pandas.DataFrame
+        все взаимодействия пользователей(см. data_helpers.create_interaction), без отсечения по дням
+    features: list of string
+        признаки, все должны поддерживаться ft_native_ds(см. native_ft_feature_names)
+    n_day: int
+        колво первых дней активности пользователя по которым строятся признаки
+    course_df: pandas.DataFrame
+        информация о степах(hb_course_info.csv), по умолчанию читается из conf.DATA_DIR
+    """
+    if course_df is None:
+        course_df = pd.read_csv(f"{conf.DATA_DIR}/hb_course_info.csv")
+    steps_matrix = ft_native_ds.gen_ft_features(interactions, course_df, features, n_day).fillna(-1)
+    if conf.COMPACT_DTYPES:
+        steps_matrix = compact_dtypes(steps_matrix)
+    return steps_matrix
+
+
+def native_ft_feature_names(course_df):
+    """ важные признаки featuretools, которые считаются без featuretools(ft_native_ds) """
+    return [feature for feature in get_ft_feature_names() if ft_native_ds.is_supported(feature, course_df)]
+
+
+def unsupported_ft_feature_names(course_df):
+    """ важные признаки featuretools, которые пока берутся только из файлов featuretools:
+    агрегаты второго уровня по степам(MEAN(events.steps.COUNT(events)) и т.п.) и
+    time_since_previous_by_step_id зависят от событий других пользователей, TREND и MODE
+    в ft_native_ds не реализованы """
+    return [feature for feature in get_ft_feature_names() if not ft_native_ds.is_supported(feature, course_df)]
+
+
 def bool2int(data):
     bool_cols = data.select_dtypes('bool')
     for col in bool_cols:
-        data[col] = np.where(data[col], 1, 0)
+        data[col] = data[col].astype(np.uint8 if conf.COMPACT_DTYPES else np.int64)
+
+
+def get_ft_feature_names():
+    """ названия важных признаков featuretools(для featuretools_ds.create_features) """
+    return list(get_importance_features_ft()[1:])
 
 
 def get_importance_features_ft():
@@ -370,3 +479,6 @@ def get_importance_features_ft():
                      'TREND(events.time_since_previous_by_user_id, date WHERE action = correct)',
                      'TREND(events.time_since_previous_by_user_id, date WHERE steps.step_block.name = choice)',
                      'TREND(events.time_since_previous_by_user_id, date WHERE steps.step_block.name = text)'])
+
+
+profiling.profile_module(__name__)
@@ -0,0 +1,194 @@
+""" Инкрементальный расчет признаков пользователей по новым порциям событий.
+
+Состояние хранит по каждому пользователю все, что нужно для признаков data_iter1,
+step_progress и баллов за степы(step_weight): колво событий по типам и сабмитов по статусам,
+дни на курсе, время первого и последнего события, колво прохождений каждого степа.
+Все считается только по первым n_day дням пользователя, как и в основном пайплайне.
+Пользователи, у которых окно n_day дней уже закончилось, замораживаются и новые
+события по ним не обрабатываются.
+
+Порции должны приходить в порядке времени: событие пользователя раньше уже
+обработанного первого события считается ошибкой.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import libs.config as conf
+import libs.features.step_progress as fsp
+from libs import data_iter1 as di1
+from libs.data.event_store import load_frame, save_frame
+from libs.utils import profiling
+from libs.utils.df_utils import compact_dtypes
+
+SECONDS_IN_DAY = 60 * 60 * 24
+
+
+class UserFeatureState:
+    """ Состояние признаков пользователей, обновляемое порциями новых событий
+
+    Parameters
+    ----------
+    n_day: int
+        колво первых дней активности пользователя по которым строятся признаки
+    """
+
+    def __init__(self, n_day=conf.DATA_PERIOD_DAYS):
+        self.n_day = n_day
+        # время самого позднего обработанного события
+        self.now = None
+        self.users = pd.DataFrame(
+            {col: pd.Series(dtype=np.float64) for col in ('events_first_ts', 'events_last_ts',
+                                                          'submissions_first_ts')},
+            index=pd.Index([], name='user_id', dtype=np.int64))
+        for col in list(conf.ACTION_CATEGORIES) + list(conf.SUBMISSION_STATUSES) + ['day_mask']:
+            self.users[col] = pd.Series(dtype=np.int64)
+        # колво прохождений степа пользователем, индекс (user_id, step_id)
+        self.steps_passed = pd.Series(index=pd.MultiIndex.from_arrays([[], []], names=['user_id', 'step_id']),
+                                      dtype=np.int64, name='passed')
+
+    @property
+    def window(self):
+        return SECONDS_IN_DAY * self.n_day
+
+    def update(self, events, submissions):
+        """ обновить состояние новой порцией данных
+
+        Parameters
+        ----------
+        events: pandas.DataFrame
+            новые действия студентов со степами
+        submissions: pandas.DataFrame
+            новые действия студентов по практике
+        """
+        batch_now = max(events.timestamp.max() if len(events) else -np.inf,
+                        submissions.timestamp.max() if len(submissions) else -np.inf)
+
+        # по замороженным пользователям ничего не пересчитываем
+        events = events[~self._is_frozen(events.user_id, 'events_first_ts')]
+        submissions = submissions[~self._is_frozen(submissions.user_id, 'submissions_first_ts')]
+
+        new_users = np.setdiff1d(np.concatenate((events.user_id.unique(), submissions.user_id.unique())),
+                                 self.users.index.values)
+        self.users = self.users.reindex(self.users.index.append(pd.Index(new_users, name='user_id')))
+        zero_cols = list(conf.ACTION_CATEGORIES) + list(conf.SUBMISSION_STATUSES) + ['day_mask']
+        self.users[zero_cols] = self.users[zero_cols].fillna(0).astype(np.int64)
+
+        self._update_first_ts(events, 'events_first_ts')
+        self._update_first_ts(submissions, 'submissions_first_ts')
+
+        events = self._in_window(events, self.users.events_first_ts)
+        submissions = self._in_window(submissions, self.users.submissions_first_ts)
+        self._add_counts(events, 'action', conf.ACTION_CATEGORIES)
+        self._add_counts(submissions, 'submission_status', conf.SUBMISSION_STATUSES)
+
+        last_ts = events.groupby('user_id')['timestamp'].max().reindex(self.users.index)
+        self.users['events_last_ts'] = np.fmax(self.users.events_last_ts.values, last_ts.values)
+
+        # дни на курсе: бит i маски - был ли пользователь на курсе в i-й день от дня первого события
+        first_day = self.users.events_first_ts.reindex(events.user_id).values // SECONDS_IN_DAY
+        day_bits = pd.DataFrame({'user_id': events.user_id.values,
+                                 'bit': np.left_shift(1, events.timestamp.values // SECONDS_IN_DAY
+                                                      - first_day.astype(np.int64))})
+        day_mask = day_bits.drop_duplicates().groupby('user_id')['bit'].sum()
+        day_mask = day_mask.reindex(self.users.index, fill_value=0).values
+        self.users['day_mask'] = np.bitwise_or(self.users.day_mask.values, day_mask)
+
+        # прохождения степов считаются от первого взаимодействия пользователя(событие или сабмит)
+        interactions_first_ts = self.users[['events_first_ts', 'submissions_first_ts']].min(axis=1)
+        passed = self._in_window(events[events.action.astype(str) == 'passed'], interactions_first_ts)
+        passed = passed.groupby(['user_id', 'step_id']).size()
+        self.steps_passed = self.steps_passed.add(passed, fill_value=0).astype(np.int64).rename('passed')
+
+        self.now = batch_now if self.now is None else max(self.now, batch_now)
+        return self
+
+    def get_x(self):
+        """ признаки пользователей как в data_iter1.get_x, с теми же типами столбцов """
+        has_events = self.users.events_first_ts.notnull().values
+        has_submissions = self.users.submissions_first_ts.notnull().values
+        # типы как в data_helpers.create_user_data_fast: счетчики float, если у части пользователей нет
+        # данных(действия и дни при этом NaN), статусы, которых нет ни у кого, data_iter1 добавляет нулями
+        X = pd.DataFrame(index=self.users.index)
+        for col in conf.SUBMISSION_STATUSES:
+            counts = self.users[col].values
+            X[col] = counts if has_submissions.all() or not counts.any() else counts.astype(np.float64)
+        for col in conf.ACTION_CATEGORIES:
+            X[col] = _nan_if_missing(self.users[col].values, has_events)
+        day_mask = self.users.day_mask.values
+        X['day'] = _nan_if_missing(sum((day_mask >> i) & 1 for i in range(self.n_day + 1)), has_events)
+        X = X.reindex(columns=di1.USER_DATA_COLUMNS)
+        if conf.COMPACT_DTYPES:
+            X = compact_dtypes(X)
+        return X.sort_index()
+
+    def get_features(self):
+        """ признаки data_iter1 вместе с признаками отношений step_progress """
+        X = self.get_x()
+        return pd.concat([X, fsp.gen_interact_features(X)], axis=1)
+
+    def get_user_step_scores(self, hard_steps_weight):
+        """ баллы за прохождение степов как в step_weight.gen_user_step_scores
+
+        Parameters
+        ----------
+        hard_steps_weight: pandas.Series
+            веса степов(см. step_weight.get_steps_weight)
+        """
+        step_user_scores = self.steps_passed.unstack().reindex(self.users.index.sort_values())
+        step_user_scores = step_user_scores / hard_steps_weight
+        step_user_scores.columns = ['score_{}'.format(col) for col in step_user_scores.columns]
+        return step_user_scores.fillna(0)
+
+    def save(self, state_dir):
+        """ сохранить состояние в каталог """
+        save_frame(self.users.reset_index(), os.path.join(state_dir, 'users'))
+        save_frame(self.steps_passed.reset_index(), os.path.join(state_dir, 'steps_passed'))
+        with open(os.path.join(state_dir, 'state.json'), 'w') as f:
+            json.dump({'n_day': self.n_day, 'now': None if self.now is None else int(self.now)}, f)
+
+    @classmethod
+    def load(cls, state_dir):
+        """ загрузить сохраненное состояние """
+        with open(os.path.join(state_dir, 'state.json')) as f:
+            params = json.load(f)
+        state = cls(params['n_day'])
+        state.now = params['now']
+        state.users = load_frame(os.path.join(state_dir, 'users'), mmap_mode=None).set_index('user_id')
+        state.steps_passed = (load_frame(os.path.join(state_dir, 'steps_passed'), mmap_mode=None)
+                              .set_index(['user_id', 'step_id'])['passed'])
+        return state
+
+    def _is_frozen(self, user_ids, first_ts_col):
+        if self.now is None:
+            return np.zeros(len(user_ids), dtype=bool)
+        first_ts = self.users[first_ts_col].reindex(user_ids).values
+        return (first_ts + self.window < self.now)
+
+    def _update_first_ts(self, data, first_ts_col):
+        batch_first_ts = data.groupby('user_id')['timestamp'].min()
+        first_ts = self.users.loc[batch_first_ts.index, first_ts_col]
+        if (batch_first_ts < first_ts).any():
+            raise ValueError('события пользователя раньше уже обработанных, порции должны идти по времени')
+        self.users.loc[batch_first_ts.index, first_ts_col] = first_ts.fillna(batch_first_ts)
+
+    def _in_window(self, data, first_ts):
+        return data[data.timestamp.values <= first_ts.reindex(data.user_id).values + self.window]
+
+    def _add_counts(self, data, col, categories):
+        if not len(data):
+            return
+        counts = data.groupby(['user_id', data[col].astype(str).values]).size().unstack()
+        counts = counts.reindex(index=self.users.index, columns=list(categories)).fillna(0)
+        self.users[list(categories)] += counts.astype(np.int64)
+
+
+def _nan_if_missing(counts, has_data):
+    if has_data.all():
+        return counts
+    return np.where(has_data, counts, np.nan)
+
+
+profiling.profile_module(__name__)
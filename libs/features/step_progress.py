@@ -4,44 +4,98 @@ import numpy as np
 import pandas as pd
 
 from libs import config as conf
+from libs.utils import profiling
+from libs.utils.df_utils import compact_dtypes
 
 
 def gen_progress_features(X):
     # расчет фич отношений
     prog_ft = pd.DataFrame(index=X.index)
 
-    prog_ft['correct_rat_attempts'] = X.correct / (X.correct + X.wrong)
+    # счетчики могут быть в компактном беззнаковом типе, сумма считается во float
+    correct, wrong = X.correct.astype(np.float64), X.wrong.astype(np.float64)
+    prog_ft['correct_rat_attempts'] = correct / (correct + wrong)
     prog_ft['correct_rat_attempts'] = prog_ft['correct_rat_attempts'].fillna(-1)
     return prog_ft
 
 
 def create_ratio_features_action(users_data):
-    dfs = []
-    for col in np.setdiff1d(conf.ACTION_CATEGORIES, ['discovered']):
-        df_iter = (users_data[col] / users_data['discovered'].replace(0, 1)).rename('{}_rat_discovered'.format(col))
-        dfs += [df_iter]
-    dfs = pd.concat(dfs, axis=1)
-    dfs = dfs.fillna(-1)
-    return dfs
+    actions = np.setdiff1d(conf.ACTION_CATEGORIES, ['discovered'])
+    return create_ratio_features(users_data, actions, ['discovered'])
 
 
 def create_ratio_features_action_subm_status(users_data):
-    dfs = []
-    for scol in conf.SUBMISSION_STATUSES:
-        for acol in conf.ACTION_CATEGORIES:
-            df_iter = (users_data[scol] / users_data[acol].replace(0, 1)).rename('{}_rat_{}'.format(scol, acol))
-            dfs += [df_iter]
-    dfs = pd.concat(dfs, axis=1)
-    dfs = dfs.fillna(-1)
-    return dfs
+    return create_ratio_features(users_data, conf.SUBMISSION_STATUSES, conf.ACTION_CATEGORIES)
 
 
 def create_ratio_features_day(users_data):
     """ сгенерировать признаки  """
-    dfs = []
-    for col in chain(conf.ACTION_CATEGORIES, conf.SUBMISSION_STATUSES):
-        df_iter = (users_data[col] / users_data.day).rename('{}_rat_day'.format(col))
-        dfs += [df_iter]
-    dfs = pd.concat(dfs, axis=1)
-    dfs = dfs.fillna(-1)
-    return dfs
+    return create_ratio_features(users_data, list(chain(conf.ACTION_CATEGORIES, conf.SUBMISSION_STATUSES)), ['day'],
+                                 replace_zero=False)
+
+
+def create_ratio_features(users_data, numerators, denominators, replace_zero=True):
+    """ признаки отношений {числитель}_rat_{знаменатель} по всем парам столбцов(см. ratio_matrix)
+
+    Returns
+    -------
+        pandas.DataFrame с индексом users_data
+    """
+    return pd.DataFrame(ratio_matrix(users_data, numerators, denominators, replace_zero),
+                        index=users_data.index, columns=ratio_names(numerators, denominators))
+
+
+def ratio_matrix(users_data, numerators, denominators, replace_zero=True, out=None):
+    """ отношения всех пар столбцов числитель / знаменатель одним делением с broadcast
+
+    Parameters
+    ----------
+    users_data: pandas.DataFrame
+        данные пользователей(см. data_helpers.create_user_data)
+    numerators, denominators: list of string
+        столбцы числителей и знаменателей
+    replace_zero: bool
+        заменять нулевые знаменатели на 1, иначе деление на 0 дает inf
+    out: numpy.ndarray
+        float64 массив пользователи x (числители x знаменатели) для результата с непрерывными
+        столбцами(order='F', как блоки pandas), если не передать - будет создан
+
+    Returns
+    -------
+        numpy.ndarray, столбцы в порядке ratio_names, неопределенные отношения(0 / 0, пропуски) равны -1
+    """
+    # деление считаем в транспонированном виде: числители x знаменатели x пользователи,
+    # чтобы внутренний цикл broadcast шел по длинной оси пользователей
+    numerator_values = np.array([users_data[col].values for col in numerators], dtype=np.float64)
+    denominator_values = np.array([users_data[col].values for col in denominators], dtype=np.float64)
+    if replace_zero:
+        denominator_values[denominator_values == 0] = 1
+    if out is None:
+        out = np.empty((len(users_data), len(numerators) * len(denominators)), order='F')
+    elif not out.flags.f_contiguous:
+        raise ValueError('out должен быть массивом с непрерывными столбцами(order=F)')
+
+    out_pairs = out.T.reshape(len(numerators), len(denominators), len(users_data))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(numerator_values[:, np.newaxis, :], denominator_values[np.newaxis, :, :], out=out_pairs)
+    np.copyto(out, -1, where=np.isnan(out))
+    return out
+
+
+def ratio_names(numerators, denominators):
+    """ названия признаков ratio_matrix """
+    return ['{}_rat_{}'.format(numerator, denominator) for numerator in numerators for denominator in denominators]
+
+
+def gen_interact_features(users_data):
+    """ все признаки отношений по таблице с данными пользователей(см. data_helpers.create_user_data) """
+    func_gen_features = (gen_progress_features, create_ratio_features_action,
+                         create_ratio_features_action_subm_status, create_ratio_features_day)
+    interact_features = [gen_fun(users_data) for gen_fun in func_gen_features]
+    interact_features = pd.concat(interact_features, axis=1).fillna(0)
+    if conf.COMPACT_DTYPES:
+        interact_features = compact_dtypes(interact_features)
+    return interact_features
+
+
+profiling.profile_module(__name__)
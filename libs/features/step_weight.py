@@ -1,37 +1,186 @@
+import logging
+import os
+
 import numpy as np
 import pandas as pd
+from scipy import sparse
+
+from libs import config as conf
+from libs.data.event_store import (META_FNAME, file_fingerprint, load_frame, read_meta, save_frame,
+                                   train_events_fname, train_submissions_fname)
+from libs.data.prepared import PreparedData
+from libs.utils import feature_cache, profiling
+
+SW_COL_NAME = 'step_weight'
+
+logger = logging.getLogger(__name__)
+
+
+def gen_user_step_scores(events, submissions, prepared=None, hard_steps_weight=None, step_ids=None):
+    """ баллы пользователя за прохождение степов с учетом сложности степа
+
+    Parameters
+    ----------
+    events: pandas.DataFrame
+        действия студентов со степами
+    submissions: pandas.DataFrame
+        действия студентов по практике
+    prepared: libs.data.prepared.PreparedData
+        общие подготовленные данные запуска, если не передать - будут созданы по events, submissions
+    hard_steps_weight: pandas.Series
+        веса степов(см. get_steps_weight), нужно передать если считаем по части пользователей
+    step_ids: list of int
+        степы, по которым нужны баллы, по умолчанию все степы из данных и весов
+    """
+    scores, user_ids, step_ids = gen_user_step_scores_sparse(events, submissions, prepared,
+                                                             hard_steps_weight, step_ids)
+    # плотная таблица строится только по выбранным степам
+    return pd.DataFrame(scores.toarray(), index=pd.Index(user_ids, name='user_id'),
+                        columns=['score_{}'.format(step_id) for step_id in step_ids])
+
+
+def gen_user_step_scores_sparse(events, submissions, prepared=None, hard_steps_weight=None, step_ids=None):
+    """ баллы пользователя за прохождение степов(см. gen_user_step_scores) в виде разреженной матрицы:
+    каждый пользователь проходит лишь несколько степов из сотен
+
+    Parameters
+    ----------
+    events: pandas.DataFrame
+        действия студентов со степами
+    submissions: pandas.DataFrame
+        действия студентов по практике
+    prepared: libs.data.prepared.PreparedData
+        общие подготовленные данные запуска, если не передать - будут созданы по events, submissions
+    hard_steps_weight: pandas.Series
+        веса степов(см. get_steps_weight), нужно передать если считаем по части пользователей
+    step_ids: list of int
+        степы(столбцы матрицы), по умолчанию все степы из данных и весов
+
+    Returns
+    -------
+        (scipy.sparse.csr_matrix пользователи x степы, numpy.ndarray отсортированных user_id строк,
+         numpy.ndarray step_id столбцов)
+    """
+    if prepared is None:
+        prepared = PreparedData(events, submissions)
+    if hard_steps_weight is None:
+        hard_steps_weight = get_steps_weight(prepared)
+
+    data_transform = prepared.interactions_nday
+    user_ids = np.unique(data_transform.user_id.values)
+    if step_ids is None:
+        step_ids = np.union1d(data_transform.step_id.unique(), hard_steps_weight.index.values)
+    step_ids = np.asarray(step_ids)
+
+    # колво прохождений каждого степа пользователем
+    passed = data_transform[(data_transform.action.astype(str) == 'passed').values]
+    step_pos = pd.Index(step_ids).get_indexer(passed.step_id.values)
+    in_steps = step_pos >= 0
+    user_pos = np.searchsorted(user_ids, passed.user_id.values[in_steps])
+    scores = sparse.csr_matrix((np.ones(in_steps.sum()), (user_pos, step_pos[in_steps])),
+                               shape=(len(user_ids), len(step_ids)))
+    scores.sum_duplicates()
+
+    # расчет баллов за прохождение задания, степы без веса дают 0
+    steps_weight = hard_steps_weight.reindex(step_ids).values
+    scores.data = scores.data / steps_weight[scores.indices]
+    scores.data[np.isnan(scores.data)] = 0
+    scores.eliminate_zeros()
+    return scores, user_ids, step_ids
+
+
+def get_steps_weight(prepared, refresh=False):
+    """ веса(сложность) степов: доля пользователей прошедших степ среди открывших его.
 
-from libs import data_helpers as dh, config as conf
+    Веса берутся из индекса статистики степов(см. calc_steps_stat), который хранится
+    вместе с отпечатком данных, по которым построен. Индекс строится по обучающим данным
+    и переиспользуется при прогнозе. Если индекса нет или он старше файлов обучающих данных
+    (см. steps_weight_outdated), он строится по данным prepared.
 
+    Parameters
+    ----------
+    prepared: libs.data.prepared.PreparedData
+        данные запуска, по ним строится индекс если его нет(или он устарел)
+    refresh: bool
+        проверить что индекс построен по этим же данным и пересобрать, если данные изменились.
+        Нужно при обучении, при прогнозе веса должны остаться от обучающих данных
+    """
+    meta = read_meta(steps_stat_dir())
+    if refresh:
+        fingerprint = data_fingerprint(prepared)
+        if meta is not None and meta['fingerprint'] == fingerprint:
+            return load_steps_weight()
+    else:
+        if meta is not None and not steps_weight_outdated():
+            return load_steps_weight()
+        fingerprint = data_fingerprint(prepared)
 
-def gen_user_step_scores(events, submissions):
-    interact_df = dh.create_interaction(events, submissions)
-    interact_df.action = interact_df.action.astype('str')
+    steps_stat = calc_steps_stat(prepared.interactions)
+    save_frame(steps_stat.reset_index(), steps_stat_dir(), fingerprint)
+    return steps_stat[SW_COL_NAME]
 
-    # расчет весов шагов
-    steps_weight_fname = f"{conf.PROCESSED_DATA_DIR}/hb_steps_weight.csv.zip"
-    sw_col_name = 'step_weight'
+
+def calc_steps_stat(interactions):
+    """ статистика по степам: колво разных пользователей совершивших каждое действие и вес степа
+
+    Parameters
+    ----------
+    interactions: pandas.DataFrame
+        взаимодействия пользователей со степами(см. data_helpers.create_interaction)
+    """
+    users_actions = interactions[['step_id', 'action', 'user_id']].drop_duplicates()
+    steps_stat = (users_actions.groupby(['step_id', users_actions.action.astype(str).values])
+                  .size().unstack())
+    steps_stat.columns.name = None
+    steps_stat = steps_stat.reindex(columns=sorted(set(steps_stat.columns) | {'discovered', 'passed'}))
+    steps_stat[SW_COL_NAME] = steps_stat.passed / steps_stat.discovered
+    return steps_stat
+
+
+def load_steps_weight():
+    """ загрузить веса степов из индекса статистики степов(если индекс еще не строился -
+    из файла прошлой версии, с предупреждением в лог) """
     try:
-        hard_steps_weight = pd.read_csv(steps_weight_fname, index_col='step_id')[sw_col_name]
+        steps_stat = load_frame(steps_stat_dir()).set_index('step_id')
     except FileNotFoundError:
-        hard_steps = interact_df.pivot_table(
-            index='step_id',
-            columns='action',
-            values='user_id',
-            aggfunc=lambda x: len(np.unique(x)))
-        hard_steps_weight = hard_steps.passed / hard_steps.discovered
-        hard_steps_weight = hard_steps_weight.rename(sw_col_name)
-        hard_steps_weight.to_csv(steps_weight_fname, header=True, compression='zip')
-
-    # расчет баллов за прохождение задания
-    data_transform = dh.truncate_data_by_nday(interact_df, conf.DATA_PERIOD_DAYS)
-    step_stat = data_transform.pivot_table(
-        index=['user_id', 'step_id'],
-        columns='action',
-        values='timestamp',
-        aggfunc='count')
-    step_user_scores = step_stat.passed.unstack() / hard_steps_weight
-    step_user_scores.columns = ['score_{}'.format(col) for col in step_user_scores.columns]
-    step_user_scores = step_user_scores.fillna(0)
-
-    return step_user_scores
+        logger.warning('индекс весов степов %s не построен, веса берутся из файла прошлой версии %s '
+                       '(постройте индекс get_steps_weight по обучающим данным)',
+                       steps_stat_dir(), steps_weight_fname())
+        return pd.read_csv(steps_weight_fname(), index_col='step_id')[SW_COL_NAME]
+    if steps_weight_outdated():
+        logger.warning('индекс весов степов %s старше файлов обучающих данных', steps_stat_dir())
+    return steps_stat[SW_COL_NAME]
+
+
+def steps_weight_outdated():
+    """ индекс весов степов построен раньше, чем изменились файлы обучающих данных """
+    index_time = os.path.getmtime(os.path.join(steps_stat_dir(), META_FNAME))
+    return any(os.path.exists(fname) and os.path.getmtime(fname) > index_time
+               for fname in (train_events_fname(), train_submissions_fname()))
+
+
+def steps_weight_fingerprint():
+    """ отпечаток весов степов, которые вернет load_steps_weight(для ключа кэша признаков):
+    отпечаток данных индекса, если индекс построен, иначе отпечаток файла прошлой версии """
+    meta = read_meta(steps_stat_dir())
+    if meta is not None:
+        return meta['fingerprint']
+    if os.path.exists(steps_weight_fname()):
+        return file_fingerprint(steps_weight_fname())
+    return ''
+
+
+def data_fingerprint(prepared):
+    """ отпечаток исходных данных, по которым строится индекс """
+    return feature_cache.data_fingerprint(prepared.raw_events, prepared.raw_submissions)
+
+
+def steps_stat_dir():
+    return f"{conf.STORE_DIR}/steps_stat"
+
+
+def steps_weight_fname():
+    return f"{conf.PROCESSED_DATA_DIR}/hb_steps_weight.csv.zip"
+
+
+profiling.profile_module(__name__)
@@ -1,12 +1,89 @@
+import numpy as np
 import pandas as pd
 
 import libs.config as conf
+from libs.data import ts_native_ds
+from libs.data.event_store import (ensure_store, file_fingerprint, load_columns, load_frame, load_rows, read_csv_cached,
+                                   read_meta, save_frame)
+from libs.utils import profiling
+from libs.utils.df_utils import compact_dtypes
 
 
 def load_cache_ts_features():
-    ts_features_train = pd.read_csv(f"{conf.PROCESSED_DATA_DIR}/ts_features_train.zip")
-    ts_features_submit = pd.read_csv(f"{conf.PROCESSED_DATA_DIR}/ts_features_submit.zip")
-    all_ts_data = pd.concat([ts_features_train, ts_features_submit])
+    all_ts_data = pd.concat([read_csv_cached(fname) for fname in ts_features_fnames()])
     all_ts_data = all_ts_data.fillna(all_ts_data.mean())
     all_ts_data = all_ts_data.set_index('user_id')
+    if conf.COMPACT_DTYPES:
+        all_ts_data = compact_dtypes(all_ts_data)
     return all_ts_data
+
+
+def load_ts_features(user_ids):
+    """ признаки tsfresh только по пользователям user_ids(через индекс по user_id в колоночном хранилище),
+    пропуски заполнены средними по всем пользователям, как в load_cache_ts_features
+
+    Parameters
+    ----------
+    user_ids: numpy.ndarray
+        id пользователей, пользователи без признаков пропускаются
+    """
+    store_dirs = [_ts_features_store(fname) for fname in ts_features_fnames()]
+    ts_data = pd.concat([load_rows(store_dir, 'user_id', user_ids) for store_dir in store_dirs])
+    ts_data = ts_data.fillna(ts_features_means(store_dirs)).set_index('user_id')
+    if conf.COMPACT_DTYPES:
+        ts_data = compact_dtypes(ts_data)
+    return ts_data
+
+
+def calc_native_ts_features(interactions_nday, features):
+    """ признаки tsfresh без tsfresh(см. ts_native_ds) по взаимодействиям пользователей. В файлах признаков
+    пропуски tsfresh(короткие ряды, нулевая дисперсия) сохранены нулями, поэтому и здесь заполняются нулями
+
+    Parameters
+    ----------
+    interactions_nday: pandas.DataFrame
+        взаимодействия за первые дни(см. data_helpers.create_interaction)
+    features: list of string
+        названия признаков(см. data_iter_auto.get_ts_feature_names)
+    """
+    ts_data = ts_native_ds.gen_ts_features(ts_native_ds.prep_ts_interact(interactions_nday), features)
+    ts_data = ts_data.fillna(0)
+    if conf.COMPACT_DTYPES:
+        ts_data = compact_dtypes(ts_data)
+    return ts_data
+
+
+def ts_features_means(store_dirs):
+    """ средние признаков tsfresh по всем пользователям, считаются один раз на версию файлов признаков """
+    fingerprint = '/'.join(read_meta(store_dir)['fingerprint'] for store_dir in store_dirs)
+    means_dir = f"{conf.STORE_DIR}/ts_features_means"
+    meta = read_meta(means_dir)
+    if meta is not None and meta['fingerprint'] == fingerprint:
+        return load_frame(means_dir, mmap_mode=None).iloc[0]
+
+    # средние по столбцам через memory-map, без сборки общего датафрейма по всем файлам
+    stores = [load_columns(store_dir) for store_dir in store_dirs]
+    names = list(dict.fromkeys(name for columns in stores for name in columns))
+    means = pd.Series({name: np.nanmean(np.concatenate([np.asarray(columns[name], dtype=np.float64)
+                                                        for columns in stores if name in columns]))
+                       for name in names})
+    save_frame(means.to_frame().T, means_dir, fingerprint)
+    return means
+
+
+def ts_features_fingerprint():
+    """ отпечаток файлов признаков tsfresh(для ключа кэша признаков) """
+    return '/'.join(file_fingerprint(fname) for fname in ts_features_fnames())
+
+
+def ts_features_fnames():
+    """ файлы сгенерированных признаков tsfresh по обучающим и тестовым пользователям """
+    return [f"{conf.PROCESSED_DATA_DIR}/ts_features_train.zip", f"{conf.PROCESSED_DATA_DIR}/ts_features_submit.zip"]
+
+
+def _ts_features_store(fname):
+    # колоночное хранилище пересобирается, если изменился файл признаков
+    return ensure_store(fname)
+
+
+profiling.profile_module(__name__)
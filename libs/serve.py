@@ -0,0 +1,213 @@
+""" Сервис онлайн прогноза is_gone по активности пользователя за первые дни на курсе.
+
+Модель финального решения(см. model-final.ipynb), веса степов и справочные данные
+загружаются один раз при старте, дальше сервис читает из stdin запросы
+по одному JSON на строку и пишет в stdout ответ тоже одной строкой JSON.
+
+Запрос - пачка пользователей:
+    {"users": [{"user_id": 1,
+                "events": [{"step_id": 30456, "timestamp": 1526893787, "action": "viewed"}, ...],
+                "submissions": [{"step_id": 31971, "timestamp": 1526800961,
+                                 "submission_status": "wrong"}, ...]}, ...]}
+Ответ:
+    {"predictions": {"1": 0.12, ...}, "approximate": ["7", ...]}
+    {"error": "..."} - если запрос не удалось обработать
+
+Признаки считаются в процессе по событиям запроса: tsfresh - через ts_native_ds,
+featuretools первого уровня - через ft_native_ds. Признаки featuretools по агрегатам
+степов(steps.COUNT(events) и т.п.) зависят от событий всех пользователей курса, поэтому
+берутся из сгенерированных файлов. Пользователи, которых нет в файлах, получают для них
+значение пропуска(-1, как в load_calc_ft_features).
+
+В "approximate" перечисляются пользователи, чей вектор признаков может отличаться от
+пакетного data_iter_final: нет в файлах featuretools или модель использует признаки tsfresh,
+зависящие от порядка точек ряда(autocorrelation с лагом > 0, c3, см. ts_native_ds.is_order_dependent).
+Файлы для обучения посчитаны tsfresh < 0.13, который на широком формате упорядочивает точки
+ряда по датам других строк пакета, поэтому такие признаки нельзя повторить по одному запросу.
+Пока модель не переобучена на признаках ts_native_ds, все прогнозы с ними приблизительные.
+
+Запуск из каталога notebooks(пути в libs.config относительные):
+    PYTHONPATH=.. python -m libs.serve
+    PYTHONPATH=.. python -m libs.serve --bench 200 --batch-size 1
+"""
+import argparse
+import json
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import libs.config as conf
+import libs.data_helpers as dh
+from libs import data_iter_final as di
+from libs.data import ts_native_ds
+from libs.data.event_store import EVENTS_COLUMNS, SUBMISSIONS_COLUMNS, load_events, load_submissions
+from libs.data.prepared import PreparedData
+from libs.data_iter_auto import get_ts_feature_names
+from libs.features.featuretools_x import calc_native_ft_features, load_calc_ft_features, native_ft_feature_names
+from libs.features.step_weight import load_steps_weight
+from libs.features.tsfresh_x import calc_native_ts_features
+
+
+class Scorer:
+    """ Модель и данные для расчета признаков, загруженные один раз на все запросы
+
+    Parameters
+    ----------
+    model_fname: string
+        путь до сохраненной joblib модели
+    """
+
+    def __init__(self, model_fname=None):
+        if model_fname is None:
+            model_fname = f"{conf.BIN_MODELS_DIR}/final_model.bin"
+        self.model = joblib.load(model_fname)
+        self.hard_steps_weight = load_steps_weight()
+        self.ts_feature_names = get_ts_feature_names()
+        # признаки, которые в обучающих файлах посчитаны по другому порядку точек ряда
+        self.ts_order_features = [feature for feature in self.ts_feature_names
+                                  if ts_native_ds.is_order_dependent(feature)]
+        self.course_df = pd.read_csv(f"{conf.DATA_DIR}/hb_course_info.csv")
+        self.native_ft_features = native_ft_feature_names(self.course_df)
+        # признаки featuretools из файлов - только для тех, что не считаются по событиям запроса
+        self.steps_matrix = load_calc_ft_features()
+
+    def features(self, events, submissions):
+        """ признаки финальной модели по событиям пользователей
+
+        Parameters
+        ----------
+        events: pandas.DataFrame
+            действия пользователей со степами
+        submissions: pandas.DataFrame
+            действия пользователей по практике
+
+        Returns
+        -------
+            (pandas.DataFrame признаков с индексом user_id,
+             numpy.ndarray user_id с приблизительными признаками, см. описание модуля)
+        """
+        prepared = PreparedData(events, submissions)
+        # ряды tsfresh по событиям и сабмитам, обрезанным отдельно, как в make_dataset_auto_features.ipynb
+        ts_interact = dh.create_interaction(prepared.events_nday, prepared.submissions_nday)
+        ts_data = calc_native_ts_features(ts_interact, self.ts_feature_names)
+        steps_matrix, unknown_users = self._ft_features(prepared)
+        X = di.get_x(events, submissions, n_jobs=1, prepared=prepared, ts_data=ts_data, steps_matrix=steps_matrix,
+                     hard_steps_weight=self.hard_steps_weight)
+        if self.ts_order_features:
+            return X, prepared.user_ids
+        return X, unknown_users
+
+    def _ft_features(self, prepared):
+        native = calc_native_ft_features(prepared.interactions, self.native_ft_features, course_df=self.course_df)
+        native = native.reindex(prepared.user_ids, fill_value=-1)
+        # признаки по агрегатам степов считаются по всем пользователям курса, их берем из файлов
+        stored_columns = [col for col in self.steps_matrix.columns if col not in native.columns]
+        unknown_users = prepared.user_ids[~np.isin(prepared.user_ids, self.steps_matrix.index.values)]
+        if not stored_columns:
+            return native, unknown_users[:0]
+        stored = self.steps_matrix[stored_columns].reindex(prepared.user_ids, fill_value=-1)
+        return pd.concat([native, stored], axis=1), unknown_users
+
+    def predict(self, events, submissions):
+        """ вероятности is_gone по пользователям
+
+        Parameters
+        ----------
+        events: pandas.DataFrame
+            действия пользователей со степами
+        submissions: pandas.DataFrame
+            действия пользователей по практике
+
+        Returns
+        -------
+            (pandas.Series вероятностей с индексом user_id,
+             numpy.ndarray user_id с приблизительными признаками, см. описание модуля)
+        """
+        X, approximate_users = self.features(events, submissions)
+        preds = pd.Series(self.model.predict_proba(di.model_matrix(X))[:, 1], index=X.index, name='is_gone')
+        return preds, approximate_users
+
+    def predict_request(self, request):
+        """ ответ на разобранный JSON запрос(см. описание модуля) """
+        events, submissions = parse_users(request['users'])
+        preds, approximate_users = self.predict(events, submissions)
+        return {'predictions': {str(user_id): float(prob) for user_id, prob in preds.items()},
+                'approximate': [str(user_id) for user_id in approximate_users]}
+
+
+def parse_users(users):
+    """ собрать из пользователей запроса таблицы events и submissions """
+    events, submissions = [], []
+    for user in users:
+        events += [dict(row, user_id=user['user_id']) for row in user.get('events', [])]
+        submissions += [dict(row, user_id=user['user_id']) for row in user.get('submissions', [])]
+    return (pd.DataFrame(events, columns=EVENTS_COLUMNS),
+            pd.DataFrame(submissions, columns=SUBMISSIONS_COLUMNS))
+
+
+def serve(scorer, fin=sys.stdin, fout=sys.stdout):
+    """ обрабатывать запросы построчно, пока не закончится входной поток """
+    for line in fin:
+        if not line.strip():
+            continue
+        try:
+            response = scorer.predict_request(json.loads(line))
+        except Exception as e:
+            response = {'error': f'{type(e).__name__}: {e}'}
+        fout.write(json.dumps(response) + '\n')
+        fout.flush()
+
+
+def make_requests(events, submissions, n_requests, batch_size, seed=0):
+    """ запросы по случайным пользователям из данных(для замера задержек) """
+    rng = np.random.RandomState(seed)
+    users_events = {user_id: df.drop('user_id', axis=1).to_dict('records')
+                    for user_id, df in events.groupby('user_id')}
+    users_submissions = {user_id: df.drop('user_id', axis=1).to_dict('records')
+                         for user_id, df in submissions.groupby('user_id')}
+    user_ids = np.array(sorted(users_events))
+    requests = []
+    for _ in range(n_requests):
+        batch = rng.choice(user_ids, batch_size, replace=False)
+        requests.append({'users': [{'user_id': int(user_id),
+                                    'events': users_events[user_id],
+                                    'submissions': users_submissions.get(user_id, [])}
+                                   for user_id in batch]})
+    return json.loads(json.dumps(requests, default=int))
+
+
+def benchmark(scorer, requests):
+    """ задержки обработки запросов в миллисекундах: p50, p99 """
+    latencies = []
+    for request in requests:
+        start = time.perf_counter()
+        scorer.predict_request(request)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {'n_requests': len(latencies),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99))}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='онлайн прогноз is_gone')
+    parser.add_argument('--model', default=None, help='путь до joblib модели')
+    parser.add_argument('--bench', type=int, default=0,
+                        help='вместо сервиса замерить задержки на BENCH запросах из тестовых данных')
+    parser.add_argument('--batch-size', type=int, default=1, help='колво пользователей в запросе для замера')
+    args = parser.parse_args(argv)
+
+    scorer = Scorer(args.model)
+    if args.bench:
+        events = load_events(f"{conf.DATA_DIR}/events_data_test.zip")
+        submissions = load_submissions(f"{conf.DATA_DIR}/submission_data_test.zip")
+        requests = make_requests(events, submissions, args.bench, args.batch_size)
+        print(json.dumps(benchmark(scorer, requests)))
+    else:
+        serve(scorer)
+
+
+if __name__ == '__main__':
+    main()
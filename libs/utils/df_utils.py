@@ -1,6 +1,8 @@
 import collections
+import hashlib
 
 import numpy as np
+import pandas as pd
 
 
 def safe_drop_cols_df(df, drop_cols):
@@ -46,3 +48,79 @@ def split_df_chunk(df, chunkSize=100):
     """
     numberChunks = len(df) // chunkSize + 1
     return np.array_split(df, numberChunks, axis=0)
+
+
+def split_df_by_key(df, key, n_parts):
+    """ разделить датафрейм на n_parts частей по хэшу столбца key.
+    Все строки с одинаковым значением key попадают в одну и ту же часть,
+    в том числе при разбиении разных датафреймов(или кусков одного файла)
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+    key: string
+        столбец, по хэшу которого делим(например user_id)
+    n_parts: int
+        колво частей
+    """
+    # номер части в наименьшем беззнаковом типе: устойчивая сортировка коротких целых идет за O(колво строк)
+    part_nums = (pd.util.hash_array(df[key].values) % n_parts).astype(np.min_scalar_type(max(n_parts - 1, 0)))
+    # одна устойчивая сортировка по номеру части вместо маски на каждую часть, порядок строк в части сохраняется
+    order = np.argsort(part_nums, kind='mergesort')
+    bounds = np.searchsorted(part_nums[order], np.arange(1, n_parts))
+    return [df.iloc[rows] for rows in np.split(order, bounds)]
+
+
+def df_fingerprint(df):
+    """ отпечаток содержимого датафрейма. Не зависит от индекса и порядка строк,
+    а также от способа хранения значений(int32/int64, категории/строки)
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+    """
+    row_hashes = pd.util.hash_pandas_object(df, index=False).values
+    cols_hash = hashlib.sha1(','.join(map(str, df.columns)).encode()).hexdigest()[:16]
+    return f'{len(df)}-{cols_hash}-{row_hashes.sum(dtype=np.uint64):016x}'
+
+
+def compact_dtypes(df, float_dtype=np.float32):
+    """ датафрейм с компактными типами столбцов: id(столбцы *_id) - int32, остальные целые
+    неотрицательные - uint16/uint32(если значения помещаются), bool - uint8, вещественные - float_dtype.
+    Категориальные и строковые столбцы и индекс не меняются
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+    float_dtype: numpy.dtype
+        тип вещественных столбцов
+    """
+    return pd.DataFrame({col: compact_values(df[col], float_dtype, is_id=str(col).endswith('_id'))
+                         for col in df.columns}, index=df.index, columns=df.columns)
+
+
+def compact_values(values, float_dtype=np.float32, is_id=False):
+    """ значения столбца в компактном типе(см. compact_dtypes) """
+    if pd.api.types.is_bool_dtype(values):
+        return values.astype(np.uint8)
+    if pd.api.types.is_integer_dtype(values):
+        return _compact_int(values, signed=is_id)
+    if pd.api.types.is_float_dtype(values):
+        return values.astype(float_dtype)
+    return values
+
+
+def _compact_int(values, signed):
+    if not len(values):
+        return values
+    low, high = values.min(), values.max()
+    dtypes = (np.uint16, np.uint32) if low >= 0 and not signed else (np.int32,)
+    for dtype in dtypes:
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values
+
+
+def to_matrix(df, dtype=np.float64):
+    """ C-непрерывная матрица значений датафрейма типа dtype(как ждут модели sklearn, без лишних копий) """
+    return np.ascontiguousarray(df.values, dtype=dtype)
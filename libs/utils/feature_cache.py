@@ -0,0 +1,177 @@
+""" Кэш матриц признаков на диске с адресацией по содержимому входных данных.
+
+Ключ записи - хэш от отпечатков events и submissions(см. df_utils.df_fingerprint),
+параметров подготовки данных(n_day, course_threshold и др., см. PreparedData.cache_params),
+COMPACT_DTYPES, имени генератора признаков, версии его кода и отпечатков
+файлов, из которых генератор читает признаки(depends). Версию нужно поднимать
+при любом изменении кода, меняющем признаки. Каждая запись - каталог с таблицами
+в колоночном формате event_store(.npy), при превышении FEATURE_CACHE_MAX_MB удаляются
+записи, к которым дольше всего не обращались.
+
+    @feature_cache.cached('data_iter1', FEATURES_VERSION)
+    def get_x_y(events, submissions, prepared=None):
+        ...
+"""
+import functools
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+
+import libs.config as conf
+import libs.utils.df_utils as dfu
+from libs.data.event_store import EVENTS_COLUMNS, SUBMISSIONS_COLUMNS, load_frame, save_frame
+
+ENTRY_FNAME = 'entry.json'
+
+# статистика обращений к кэшу в текущем процессе
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def cached(name, version, depends=None):
+    """ декоратор генератора признаков func(events, submissions, ...) -> DataFrame, Series или их кортеж.
+    Из остальных аргументов в ключ входят параметры переданного PreparedData(n_day, course_threshold,
+    target_action, day_as_int), без него - параметры по умолчанию. Прочие аргументы в ключ не входят,
+    поэтому не должны влиять на результат(n_jobs)
+
+    Parameters
+    ----------
+    name: string
+        имя генератора признаков
+    version: int
+        версия кода генератора
+    depends: callable
+        функция без аргументов, возвращает строку-отпечаток файлов(признаков, весов), которые
+        читает генератор. Вызывается при каждом обращении, входит в ключ
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(events, submissions, *args, **kwargs):
+            if not conf.FEATURE_CACHE_MAX_MB:
+                return func(events, submissions, *args, **kwargs)
+            key = cache_key(name, version, events, submissions, _prepared_params(events, submissions, args, kwargs),
+                            depends() if depends else '')
+            result = load(key)
+            if result is None:
+                result = func(events, submissions, *args, **kwargs)
+                save(key, result)
+            return result
+        return wrapper
+    return decorator
+
+
+def cache_key(name, version, events, submissions, params, depends=''):
+    """ ключ записи кэша(params - параметры подготовки данных, depends - отпечаток файлов,
+    от которых зависит результат) """
+    key = '|'.join([name, str(version), str(params), str(conf.COMPACT_DTYPES), data_fingerprint(events, submissions),
+                    depends])
+    return f'{name}-{hashlib.sha1(key.encode()).hexdigest()[:24]}'
+
+
+def _prepared_params(events, submissions, args, kwargs):
+    """ параметры подготовки данных аргумента PreparedData или параметры по умолчанию """
+    # prepared импортирует data_helpers, а тот через profiling - этот модуль
+    from libs.data.prepared import PreparedData
+    for arg in list(args) + list(kwargs.values()):
+        if isinstance(arg, PreparedData):
+            return arg.cache_params()
+    return PreparedData(events, submissions).cache_params()
+
+
+def data_fingerprint(events, submissions):
+    """ отпечаток исходных данных(только исходные столбцы, добавленные при обработке не учитываются) """
+    return '{}/{}'.format(dfu.df_fingerprint(events[EVENTS_COLUMNS]),
+                          dfu.df_fingerprint(submissions[SUBMISSIONS_COLUMNS]))
+
+
+def load(key):
+    """ результат из кэша или None """
+    entry_dir = os.path.join(conf.FEATURE_CACHE_DIR, key)
+    try:
+        with open(os.path.join(entry_dir, ENTRY_FNAME)) as f:
+            parts_meta = json.load(f)['parts']
+    except FileNotFoundError:
+        _stats['misses'] += 1
+        return None
+
+    parts = [_load_part(os.path.join(entry_dir, f'part_{i}'), part_meta)
+             for i, part_meta in enumerate(parts_meta)]
+    # время обращения для вытеснения давно не используемых записей
+    os.utime(os.path.join(entry_dir, ENTRY_FNAME))
+    _stats['hits'] += 1
+    return tuple(parts) if len(parts) > 1 else parts[0]
+
+
+def save(key, result):
+    """ сохранить результат в кэш и вытеснить старые записи, если кэш превысил размер """
+    entry_dir = os.path.join(conf.FEATURE_CACHE_DIR, key)
+    parts = result if isinstance(result, tuple) else (result,)
+    parts_meta = [_save_part(os.path.join(entry_dir, f'part_{i}'), part) for i, part in enumerate(parts)]
+    # описание записи пишем последним, чтобы недописанная запись не считалась валидной
+    entry_fname = os.path.join(entry_dir, ENTRY_FNAME)
+    with open(entry_fname + '.tmp', 'w') as f:
+        json.dump({'parts': parts_meta, 'created': time.time()}, f)
+    os.replace(entry_fname + '.tmp', entry_fname)
+    evict(conf.FEATURE_CACHE_MAX_MB * 2 ** 20)
+
+
+def evict(max_bytes):
+    """ удалять записи, к которым дольше всего не обращались, пока размер кэша больше max_bytes """
+    entries = []
+    for key in os.listdir(conf.FEATURE_CACHE_DIR) if os.path.isdir(conf.FEATURE_CACHE_DIR) else []:
+        entry_dir = os.path.join(conf.FEATURE_CACHE_DIR, key)
+        entry_fname = os.path.join(entry_dir, ENTRY_FNAME)
+        if os.path.exists(entry_fname):
+            entries.append((os.path.getmtime(entry_fname), _dir_size(entry_dir), entry_dir))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, entry_dir in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total_bytes -= size
+        _stats['evictions'] += 1
+
+
+def cache_stats():
+    """ статистика обращений к кэшу в текущем процессе и размер кэша на диске """
+    size = _dir_size(conf.FEATURE_CACHE_DIR) if os.path.isdir(conf.FEATURE_CACHE_DIR) else 0
+    return dict(_stats, size_mb=size / 2 ** 20)
+
+
+def cache_counters():
+    """ счетчики обращений к кэшу в текущем процессе(без обхода каталога кэша) """
+    return dict(_stats)
+
+
+def clear():
+    """ удалить все записи кэша """
+    shutil.rmtree(conf.FEATURE_CACHE_DIR, ignore_errors=True)
+
+
+def _save_part(part_dir, part):
+    part_meta = {'kind': 'series' if isinstance(part, pd.Series) else 'frame',
+                 'index': list(part.index.names)}
+    if part_meta['kind'] == 'series':
+        part_meta['name'] = part.name
+        part = part.to_frame('__values__')
+    index_cols = [f'__index_{i}__' for i in range(part.index.nlevels)]
+    save_frame(part.rename_axis(index_cols).reset_index(), part_dir)
+    return part_meta
+
+
+def _load_part(part_dir, part_meta):
+    index_cols = [f'__index_{i}__' for i in range(len(part_meta['index']))]
+    part = load_frame(part_dir, mmap_mode=None).set_index(index_cols)
+    part = part.rename_axis(part_meta['index'])
+    if part_meta['kind'] == 'series':
+        part = part['__values__'].rename(part_meta['name'])
+    return part
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, fname))
+               for root, _, fnames in os.walk(path) for fname in fnames)
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import libs.config as conf
+from libs.data.event_store import load_columns, save_frame
+from libs.data.prepared import PreparedData
+
+# исходные таблицы, из которых PreparedData шарда считает остальные
+RAW_TABLES = ('raw_events', 'raw_submissions')
+
+
+def map_user_shards(func, prepared, n_jobs=conf.N_JOBS, n_shards=None, tables=()):
+    """ посчитать признаки func(events, submissions, prepared) по шардам пользователей в пуле процессов.
+    Исходные данные и таблицы tables готовятся в текущем процессе один раз и пишутся во временное
+    колоночное хранилище(event_store) строками подряд по шардам. Процессу передаются только каталоги
+    и границы строк шарда, он читает свои строки через memory-map, таблицы не сериализуются pickle
+
+    Parameters
+    ----------
+    func: callable
+        генератор признаков func(events, submissions, prepared) -> pandas.DataFrame с индексом user_id,
+        должен сериализоваться pickle(функция уровня модуля или functools.partial)
+    prepared: libs.data.prepared.PreparedData
+        подготовленные данные запуска
+    n_jobs: int
+        колво процессов, при 1 расчет идет в текущем процессе без разбиения
+    n_shards: int
+        колво шардов пользователей, по умолчанию n_jobs
+    tables: list of string
+        таблицы prepared, которые использует func(например events_nday, interactions_nday)
+
+    Returns
+    -------
+        pandas.DataFrame отсортированный по user_id
+    """
+    if n_jobs <= 1:
+        return func(prepared.raw_events, prepared.raw_submissions, prepared).sort_index()
+    if n_shards is None:
+        n_shards = n_jobs
+
+    store_dir = tempfile.mkdtemp(prefix='user_shards_')
+    try:
+        bounds = {name: _save_by_shards(getattr(prepared, name), os.path.join(store_dir, name), n_shards)
+                  for name in RAW_TABLES + tuple(tables)}
+        params = (prepared.n_day, prepared.course_threshold, prepared.target_action, prepared.day_as_int)
+        tasks = [(func, store_dir, {name: name_bounds[i] for name, name_bounds in bounds.items()}, params)
+                 for i in range(n_shards)
+                 if any(bounds[name][i][1] > bounds[name][i][0] for name in RAW_TABLES)]
+        with ProcessPoolExecutor(n_jobs) as pool:
+            features = list(pool.map(_calc_shard, tasks))
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+    return pd.concat(features).sort_index()
+
+
+def _save_by_shards(df, store_dir, n_shards):
+    """ сохранить строки таблицы подряд по шардам(хэш user_id, как df_utils.split_df_by_key),
+    возвращает границы строк [start, stop) каждого шарда """
+    part_nums = pd.util.hash_array(df['user_id'].values) % n_shards
+    order = np.argsort(part_nums, kind='mergesort')
+    save_frame(df.iloc[order], store_dir)
+    starts = np.searchsorted(part_nums[order], np.arange(n_shards + 1))
+    return [(int(starts[i]), int(starts[i + 1])) for i in range(n_shards)]
+
+
+def _load_rows(store_dir, start, stop):
+    # из memory-map в память читаются только строки шарда
+    columns = load_columns(store_dir, rows=slice(start, stop))
+    return pd.DataFrame(columns, columns=list(columns))
+
+
+def _calc_shard(task):
+    func, store_dir, bounds, params = task
+    data = {name: _load_rows(os.path.join(store_dir, name), *name_bounds) for name, name_bounds in bounds.items()}
+    prepared = PreparedData(data.pop('raw_events'), data.pop('raw_submissions'), *params)
+    prepared._cache.update(data)
+    return func(prepared.raw_events, prepared.raw_submissions, prepared)
@@ -0,0 +1,169 @@
+""" Профилирование этапов пайплайна признаков.
+
+Публичные функции data_helpers, features.* и data_iter_* обернуты profile_module: при
+включенном профилировании каждый вызов записывается в трассу - время, колво строк на
+входе(датафреймы и массивы в аргументах) и на выходе, изменение RSS процесса, попадания
+и промахи кэша признаков(feature_cache). Вложенные вызовы записываются с глубиной.
+Выключенное профилирование стоит одну проверку флага на вызов.
+
+Включается conf.PROFILE(читается при каждом вызове, его можно менять во время работы),
+переменной окружения LIBS_PROFILE=1 или enable(); enable()/disable() важнее conf.PROFILE:
+    profiling.enable()
+    X, y = di.get_x_y(events, submissions)
+    print(profiling.summary())
+
+Вызовы в процессах map_user_shards записываются в трассу процесса-обработчика и сюда не попадают.
+"""
+import functools
+import os
+import sys
+import time
+import types
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import libs.config as conf
+from libs.utils import feature_cache
+
+_env_enabled = os.environ.get('LIBS_PROFILE', '') not in ('', '0')
+# значение enable()/disable(), None - по conf.PROFILE и LIBS_PROFILE
+_enabled = None
+_trace = []
+_depth = 0
+
+
+def enable():
+    """ включить запись вызовов """
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """ выключить запись вызовов """
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    """ включено ли профилирование """
+    if _enabled is None:
+        return conf.PROFILE or _env_enabled
+    return _enabled
+
+
+def reset():
+    """ очистить трассу """
+    del _trace[:]
+
+
+def profiled(func):
+    """ декоратор: записывать вызовы func в трассу, когда профилирование включено """
+    name = f'{func.__module__}.{func.__qualname__}'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not is_enabled():
+            return func(*args, **kwargs)
+        with profile(name, rows_in=_count_rows(args) + _count_rows(kwargs.values())) as record:
+            result = func(*args, **kwargs)
+            record['rows_out'] = _count_rows(result if isinstance(result, tuple) else (result,))
+        return result
+    wrapper.__wrapped_profiled__ = True
+    return wrapper
+
+
+@contextmanager
+def profile(name, rows_in=None):
+    """ записать выполнение блока в трассу(если профилирование выключено - ничего не делает)
+
+    Parameters
+    ----------
+    name: string
+        название этапа
+    rows_in: int
+        колво строк на входе
+
+    Yields
+    ------
+        dict записи трассы, в него можно дописать rows_out
+    """
+    global _depth
+    record = {'name': name, 'depth': _depth, 'rows_in': rows_in, 'rows_out': None}
+    if not is_enabled():
+        yield record
+        return
+
+    stats_before = feature_cache.cache_counters()
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    _depth += 1
+    try:
+        yield record
+    finally:
+        _depth -= 1
+        record['seconds'] = time.perf_counter() - start
+        record['mem_delta_mb'] = _rss_mb() - rss_before
+        stats_after = feature_cache.cache_counters()
+        record['cache_hits'] = stats_after['hits'] - stats_before['hits']
+        record['cache_misses'] = stats_after['misses'] - stats_before['misses']
+        _trace.append(record)
+
+
+def trace():
+    """ записи трассы в порядке завершения вызовов """
+    return list(_trace)
+
+
+def trace_frame():
+    """ трасса как pandas.DataFrame """
+    return pd.DataFrame(_trace, columns=['name', 'depth', 'seconds', 'rows_in', 'rows_out', 'mem_delta_mb',
+                                         'cache_hits', 'cache_misses'])
+
+
+def summary():
+    """ сводка по функциям: колво вызовов, суммарное и максимальное время, строки, память, кэш.
+    Отсортирована по суммарному времени """
+    trace_df = trace_frame()
+    summary_df = trace_df.groupby('name').agg({'seconds': ['size', 'sum', 'max'], 'rows_in': 'sum', 'rows_out': 'sum',
+                                               'mem_delta_mb': 'max', 'cache_hits': 'sum', 'cache_misses': 'sum'})
+    summary_df.columns = ['calls', 'total_seconds', 'max_seconds', 'rows_in', 'rows_out', 'max_mem_delta_mb',
+                          'cache_hits', 'cache_misses']
+    return summary_df.sort_values('total_seconds', ascending=False)
+
+
+def profile_module(module_name):
+    """ обернуть profiled все публичные функции модуля и публичные методы его классов
+    (вызывается в конце модуля) """
+    module = sys.modules[module_name]
+    for attr, value in list(vars(module).items()):
+        if attr.startswith('_') or getattr(value, '__module__', None) != module_name:
+            continue
+        if isinstance(value, type):
+            for method_name, method in list(vars(value).items()):
+                if not method_name.startswith('_') and _is_plain_function(method):
+                    setattr(value, method_name, profiled(method))
+        elif _is_plain_function(value):
+            setattr(module, attr, profiled(value))
+
+
+def _is_plain_function(value):
+    return isinstance(value, types.FunctionType) and not getattr(value, '__wrapped_profiled__', False)
+
+
+def _count_rows(values):
+    rows = 0
+    for value in values:
+        if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+            rows += len(value)
+    return rows
+
+
+def _rss_mb():
+    """ текущий RSS процесса в МБ(Linux), иначе 0 """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return 0.
@@ -0,0 +1,57 @@
+""" create_user_data_fast совпадает с create_user_data(сводные таблицы и outer merge) """
+import numpy as np
+import pandas as pd
+import pytest
+
+import libs.data_helpers as dh
+
+DAY = 60 * 60 * 24
+START = 1500000000
+
+
+@pytest.fixture
+def events():
+    rng = np.random.RandomState(0)
+    actions = ['discovered', 'viewed', 'started_attempt', 'passed']
+    rows = [(rng.randint(10, 20), START + rng.randint(0, 4 * DAY), actions[rng.randint(len(actions))], user_id)
+            for user_id in range(1, 21) for _ in range(rng.randint(1, 15))]
+    return pd.DataFrame(rows, columns=['step_id', 'timestamp', 'action', 'user_id'])
+
+
+@pytest.fixture
+def submissions():
+    rng = np.random.RandomState(1)
+    statuses = ['wrong', 'correct']
+    # пользователи 1-10 без сабмитов, 21-25 только с сабмитами
+    rows = [(rng.randint(10, 20), START + rng.randint(0, 4 * DAY), statuses[rng.randint(len(statuses))], user_id)
+            for user_id in range(11, 26) for _ in range(rng.randint(1, 8))]
+    return pd.DataFrame(rows, columns=['step_id', 'timestamp', 'submission_status', 'user_id'])
+
+
+def assert_same_user_data(events, submissions, day_as_int=True):
+    events = dh.preprocess_timestamp_cols(events.copy(), day_as_int)
+    submissions = dh.preprocess_timestamp_cols(submissions.copy(), day_as_int)
+    expected = dh.create_user_data(events, submissions).sort_values('user_id').reset_index(drop=True)
+    pd.testing.assert_frame_equal(dh.create_user_data_fast(events, submissions), expected)
+
+
+@pytest.mark.parametrize('day_as_int', [True, False])
+def test_same_as_create_user_data(events, submissions, day_as_int):
+    assert_same_user_data(events, submissions, day_as_int)
+
+
+@pytest.mark.parametrize('users', [range(1, 21), range(11, 21), range(11, 26)],
+                         ids=['all_with_events', 'all_with_both', 'all_with_submissions'])
+def test_users_subset(events, submissions, users):
+    # типы столбцов зависят от того, у всех ли пользователей есть события и сабмиты
+    assert_same_user_data(events[events.user_id.isin(users)], submissions[submissions.user_id.isin(users)])
+
+
+def test_single_status(events, submissions):
+    assert_same_user_data(events, submissions[submissions.submission_status == 'correct'])
+
+
+def test_categorical_columns(events, submissions):
+    events = events.assign(action=pd.Categorical(events.action))
+    submissions = submissions.assign(submission_status=pd.Categorical(submissions.submission_status))
+    assert_same_user_data(events, submissions)
@@ -0,0 +1,58 @@
+""" load_calc_ft_features без сгенерированных файлов featuretools """
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import libs.config as conf
+import libs.data_helpers as dh
+from libs.features import featuretools_x
+
+DAY = 60 * 60 * 24
+START = 1500000000
+COURSE_FNAME = os.path.join(os.path.dirname(__file__), '..', 'data', 'hb_course_info.csv')
+
+
+@pytest.fixture
+def course_df():
+    return pd.read_csv(COURSE_FNAME)
+
+
+@pytest.fixture
+def interactions(course_df):
+    rng = np.random.RandomState(0)
+    step_ids = course_df.step_id.values
+    actions = ['discovered', 'viewed', 'started_attempt', 'passed']
+    events = pd.DataFrame([(rng.choice(step_ids), START + rng.randint(0, 4 * DAY), actions[rng.randint(4)], user_id)
+                           for user_id in range(1, 6) for _ in range(rng.randint(1, 20))],
+                          columns=['step_id', 'timestamp', 'action', 'user_id'])
+    submissions = pd.DataFrame([(rng.choice(step_ids), START + rng.randint(0, 4 * DAY), 'correct', user_id)
+                                for user_id in range(1, 4)],
+                               columns=['step_id', 'timestamp', 'submission_status', 'user_id'])
+    return dh.create_interaction(events, submissions)
+
+
+@pytest.fixture(autouse=True)
+def no_ft_files(monkeypatch, tmp_path):
+    monkeypatch.setattr(conf, 'PROCESSED_DATA_DIR', str(tmp_path))
+
+
+def test_native_features(interactions, course_df):
+    features = featuretools_x.native_ft_feature_names(course_df)
+    actual = featuretools_x.load_calc_ft_features(interactions, course_df=course_df, features=features)
+    expected = featuretools_x.calc_native_ft_features(interactions, features, course_df=course_df)
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_unsupported_features(interactions, course_df):
+    unsupported = featuretools_x.unsupported_ft_feature_names(course_df)
+    assert unsupported
+    assert not set(unsupported) & set(featuretools_x.native_ft_feature_names(course_df))
+    with pytest.raises(NotImplementedError, match=r'\(events\.steps\.COUNT\(events\)\)'):
+        featuretools_x.load_calc_ft_features(interactions, course_df=course_df)
+
+
+def test_no_interactions():
+    with pytest.raises(FileNotFoundError):
+        featuretools_x.load_calc_ft_features()
@@ -0,0 +1,60 @@
+""" ft_native_ds.gen_ft_features совпадает с featuretools.calculate_feature_matrix """
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import libs.data_helpers as dh
+from libs.data import ft_native_ds
+from libs.features.featuretools_x import native_ft_feature_names
+
+ft = pytest.importorskip('featuretools')
+from libs.data import featuretools_ds as ft_ds  # noqa: E402 featuretools_ds импортирует featuretools
+
+DAY = 60 * 60 * 24
+START = 1500000000
+COURSE_FNAME = os.path.join(os.path.dirname(__file__), '..', 'data', 'hb_course_info.csv')
+# остальные примитивы с условием и без есть среди важных признаков
+EXTRA_FEATURES = ['AVG_TIME_BETWEEN(events.date)', 'TIME_SINCE_FIRST(events.date)']
+
+
+@pytest.fixture(scope='module')
+def course_df():
+    course_df = pd.read_csv(COURSE_FNAME)
+    # как в make_dataset_auto_features.ipynb
+    for col in ['step_worth', 'step_actions.submit_#']:
+        course_df[col] = course_df[col].astype('bool')
+    return course_df
+
+
+@pytest.fixture(scope='module')
+def data(course_df):
+    rng = np.random.RandomState(0)
+    step_ids = course_df.step_id.values
+    actions = ['discovered', 'viewed', 'started_attempt', 'passed']
+    statuses = ['wrong', 'correct']
+    events, submissions = [], []
+    # события на протяжении 4 дней: часть после порога отсечения, у пользователя 1 одно событие
+    for user_id in range(1, 13):
+        first_ts = START + rng.randint(0, DAY)
+        n_events = 1 if user_id == 1 else rng.randint(2, 40)
+        for ts in first_ts + np.r_[0, rng.randint(0, 4 * DAY, n_events - 1)]:
+            events.append((rng.choice(step_ids), ts, actions[rng.randint(len(actions))], user_id))
+        for ts in first_ts + rng.randint(0, 4 * DAY, rng.randint(0, 10)):
+            submissions.append((rng.choice(step_ids), ts, statuses[rng.randint(len(statuses))], user_id))
+    return (pd.DataFrame(events, columns=['step_id', 'timestamp', 'action', 'user_id']),
+            pd.DataFrame(submissions, columns=['step_id', 'timestamp', 'submission_status', 'user_id']))
+
+
+def test_same_as_featuretools(data, course_df, tmp_path):
+    events, submissions = data
+    features = native_ft_feature_names(course_df) + EXTRA_FEATURES
+
+    es, cut_off_time = ft_ds.prepare_ft(events.copy(), submissions.copy(), course_df)
+    feature_defs = ft_ds.get_feature_defs(es, features, str(tmp_path / 'feature_defs.json'))
+    expected = ft.calculate_feature_matrix(feature_defs, entityset=es, cutoff_time=cut_off_time, n_jobs=1)
+
+    native = ft_native_ds.gen_ft_features(dh.create_interaction(events, submissions), course_df, features)
+    expected = expected.reindex(native.index)[features].astype(np.float64)
+    np.testing.assert_allclose(native.values, expected.values, rtol=1e-7, atol=1e-9, equal_nan=True)
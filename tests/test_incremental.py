@@ -0,0 +1,73 @@
+""" UserFeatureState, обновленное порциями событий, совпадает с пакетным расчетом data_iter1 и step_weight """
+import numpy as np
+import pandas as pd
+import pytest
+
+import libs.config as conf
+import libs.features.step_progress as fsp
+from libs import data_iter1 as di1
+from libs.features.incremental import UserFeatureState
+from libs.features.step_weight import gen_user_step_scores
+
+DAY = 60 * 60 * 24
+START = 1500000000
+ACTIONS = ['discovered', 'viewed', 'started_attempt', 'passed']
+STATUSES = ['wrong', 'correct']
+
+
+@pytest.fixture
+def events():
+    rng = np.random.RandomState(0)
+    rows = []
+    # пользователи 1-20 с событиями на протяжении 5 дней, 21-25 только с сабмитами
+    for user_id in range(1, 21):
+        first_ts = START + rng.randint(0, 3 * DAY)
+        for ts in np.sort(first_ts + rng.randint(0, 5 * DAY, rng.randint(1, 30))):
+            rows.append((rng.randint(10, 16), ts, ACTIONS[rng.randint(len(ACTIONS))], user_id))
+    return pd.DataFrame(rows, columns=['step_id', 'timestamp', 'action', 'user_id'])
+
+
+@pytest.fixture
+def submissions():
+    rng = np.random.RandomState(1)
+    rows = []
+    # у пользователей 1-10 сабмитов нет
+    for user_id in range(11, 26):
+        first_ts = START + rng.randint(0, 3 * DAY)
+        for ts in np.sort(first_ts + rng.randint(0, 5 * DAY, rng.randint(1, 10))):
+            rows.append((rng.randint(10, 16), ts, STATUSES[rng.randint(len(STATUSES))], user_id))
+    return pd.DataFrame(rows, columns=['step_id', 'timestamp', 'submission_status', 'user_id'])
+
+
+def replay(events, submissions, n_day, n_batches, state_dir):
+    """ состояние по порциям событий одинаковой длительности, в середине сохраняется и загружается """
+    edges = np.linspace(START, max(events.timestamp.max(), submissions.timestamp.max()) + 1, n_batches + 1)
+    state = UserFeatureState(n_day)
+    for i, (start, stop) in enumerate(zip(edges[:-1], edges[1:])):
+        state.update(events[(events.timestamp >= start) & (events.timestamp < stop)],
+                     submissions[(submissions.timestamp >= start) & (submissions.timestamp < stop)])
+        if i == n_batches // 2:
+            state.save(str(state_dir))
+            state = UserFeatureState.load(str(state_dir))
+    return state
+
+
+@pytest.mark.parametrize('n_day', [1, 2])
+@pytest.mark.parametrize('n_batches', [1, 7])
+def test_features_same_as_batch(events, submissions, n_day, n_batches, tmp_path, monkeypatch):
+    monkeypatch.setattr(conf, 'DATA_PERIOD_DAYS', n_day)
+    X = di1.get_x(events, submissions)
+    expected = pd.concat([X, fsp.gen_interact_features(X)], axis=1)
+
+    features = replay(events, submissions, n_day, n_batches, tmp_path).get_features()
+    # типы тоже совпадают: у части пользователей нет сабмитов или событий
+    pd.testing.assert_frame_equal(features, expected, check_names=False)
+
+
+def test_scores_same_as_batch(events, submissions, tmp_path):
+    steps_weight = pd.Series([0.5, 0.25, 1., 0.8, 0.1, 0.6], index=pd.Index(range(10, 16), name='step_id'))
+    expected = gen_user_step_scores(events, submissions, hard_steps_weight=steps_weight)
+
+    scores = replay(events, submissions, 2, 7, tmp_path).get_user_step_scores(steps_weight)
+    pd.testing.assert_frame_equal(scores.reindex(columns=expected.columns, fill_value=0.), expected,
+                                  check_names=False)
@@ -0,0 +1,62 @@
+""" признаки отношений step_progress через ratio_matrix совпадают с прежним расчетом по парам столбцов """
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import libs.config as conf
+import libs.features.step_progress as fsp
+
+
+def ratio_features_pairs(users_data, numerators, denominators, replace_zero=True):
+    """ прежняя реализация create_ratio_features_*: отношение на каждую пару столбцов """
+    dfs = []
+    for numerator in numerators:
+        for denominator in denominators:
+            denominator_values = users_data[denominator]
+            if replace_zero:
+                denominator_values = denominator_values.replace(0, 1)
+            dfs += [(users_data[numerator] / denominator_values).rename('{}_rat_{}'.format(numerator, denominator))]
+    return pd.concat(dfs, axis=1).fillna(-1)
+
+
+@pytest.fixture
+def users_data():
+    rng = np.random.RandomState(0)
+    columns = list(conf.SUBMISSION_STATUSES) + list(conf.ACTION_CATEGORIES) + ['day']
+    users_data = pd.DataFrame(rng.randint(0, 4, (50, len(columns))), columns=columns,
+                              index=pd.Index(np.arange(100, 150), name='user_id')).astype(np.float64)
+    # пользователи без событий(NaN как в create_user_data_fast) и с нулевыми знаменателями
+    users_data.loc[users_data.index[:5], list(conf.ACTION_CATEGORIES) + ['day']] = np.nan
+    users_data.loc[users_data.index[5:10], :] = 0
+    return users_data
+
+
+@pytest.mark.parametrize('gen_features, numerators, denominators, replace_zero', [
+    (fsp.create_ratio_features_action,
+     np.setdiff1d(conf.ACTION_CATEGORIES, ['discovered']), ['discovered'], True),
+    (fsp.create_ratio_features_action_subm_status, conf.SUBMISSION_STATUSES, conf.ACTION_CATEGORIES, True),
+    (fsp.create_ratio_features_day,
+     list(chain(conf.ACTION_CATEGORIES, conf.SUBMISSION_STATUSES)), ['day'], False),
+], ids=['action', 'action_subm_status', 'day'])
+def test_same_as_pairs(users_data, gen_features, numerators, denominators, replace_zero):
+    expected = ratio_features_pairs(users_data, numerators, denominators, replace_zero)
+    pd.testing.assert_frame_equal(gen_features(users_data), expected)
+
+
+def test_integer_counts(users_data):
+    # счетчики без пропусков приходят целыми(в том числе компактными беззнаковыми)
+    counts = users_data.iloc[5:].astype(np.uint8)
+    expected = ratio_features_pairs(counts.astype(np.int64), conf.SUBMISSION_STATUSES, conf.ACTION_CATEGORIES)
+    pd.testing.assert_frame_equal(fsp.create_ratio_features_action_subm_status(counts), expected)
+
+
+def test_out(users_data):
+    out = np.empty((len(users_data), len(conf.SUBMISSION_STATUSES) * 2), order='F')
+    result = fsp.ratio_matrix(users_data, conf.SUBMISSION_STATUSES, ['viewed', 'day'], out=out)
+    assert result is out
+    np.testing.assert_array_equal(out, fsp.ratio_matrix(users_data, conf.SUBMISSION_STATUSES, ['viewed', 'day']))
+
+    with pytest.raises(ValueError):
+        fsp.ratio_matrix(users_data, conf.SUBMISSION_STATUSES, ['viewed', 'day'], out=np.empty(out.shape))
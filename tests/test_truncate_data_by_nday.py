@@ -0,0 +1,87 @@
+""" truncate_data_by_nday совпадает с прежней реализацией через merge минимального времени пользователя """
+import numpy as np
+import pandas as pd
+import pytest
+
+import libs.data_helpers as dh
+
+DAY = 60 * 60 * 24
+
+
+def truncate_data_by_nday_merge(data, n_day):
+    """ прежняя реализация truncate_data_by_nday """
+    users_min_time = data.groupby('user_id', as_index=False).agg({'timestamp': 'min'}).rename(
+        {'timestamp': 'min_timestamp'}, axis=1)
+    users_min_time['min_timestamp'] += 60 * 60 * 24 * n_day
+
+    events_data_d = pd.merge(data, users_min_time, how='inner', on='user_id')
+    cond = events_data_d['timestamp'] <= events_data_d['min_timestamp']
+    events_data_d = events_data_d[cond]
+
+    assert events_data_d.user_id.nunique() == data.user_id.nunique()
+    return events_data_d.drop(['min_timestamp'], axis=1)
+
+
+@pytest.fixture
+def events():
+    start = 1500000000
+    return pd.DataFrame([
+        # пользователь 1: события точно на границе окна и сразу после нее
+        (10, start, 'discovered', 1),
+        (10, start + DAY, 'viewed', 1),
+        (11, start + DAY + 1, 'viewed', 1),
+        (11, start + 2 * DAY, 'passed', 1),
+        (12, start + 2 * DAY + 1, 'viewed', 1),
+        # пользователь 2: только события, строки не по порядку времени
+        (10, start + 5 * DAY, 'viewed', 2),
+        (10, start + 3 * DAY, 'discovered', 2),
+        (11, start + 3 * DAY + 100, 'started_attempt', 2),
+        # пользователь 4: события и сабмиты начинаются в разное время
+        (10, start + 10 * DAY, 'discovered', 4),
+        (11, start + 11 * DAY, 'passed', 4),
+    ], columns=['step_id', 'timestamp', 'action', 'user_id'])
+
+
+@pytest.fixture
+def submissions():
+    start = 1500000000
+    return pd.DataFrame([
+        # пользователь 3: только сабмиты, один ровно на границе окна
+        (11, start, 'wrong', 3),
+        (11, start + DAY, 'correct', 3),
+        (12, start + DAY + 1, 'wrong', 3),
+        (11, start + 12 * DAY, 'correct', 4),
+        (12, start + 14 * DAY, 'correct', 4),
+    ], columns=['step_id', 'timestamp', 'submission_status', 'user_id'])
+
+
+def row_set(df):
+    return sorted(map(tuple, df.astype(str).values.tolist()))
+
+
+@pytest.mark.parametrize('n_day', [1, 2, 3])
+@pytest.mark.parametrize('source', ['events', 'submissions', 'interactions'])
+def test_same_rows_as_merge(events, submissions, source, n_day):
+    data = {'events': events,
+            'submissions': submissions,
+            'interactions': dh.create_interaction(events, submissions)}[source]
+    truncated = dh.truncate_data_by_nday(data, n_day)
+
+    assert row_set(truncated) == row_set(truncate_data_by_nday_merge(data, n_day))
+    assert list(truncated.columns) == list(data.columns)
+    # строки сохраняют исходный порядок и индекс(в interactions индекс повторяется)
+    positions = dh.truncate_data_by_nday(data.assign(pos=np.arange(len(data))), n_day).pos.values
+    assert (np.diff(positions) > 0).all()
+    assert (truncated.index == data.index[positions]).all()
+
+
+def test_boundary_row_included(events):
+    truncated = dh.truncate_data_by_nday(events, 1)
+    assert set(truncated[truncated.user_id == 1].timestamp - events.timestamp.min()) == {0, DAY}
+
+
+def test_user_without_events_kept_in_interactions(events, submissions):
+    interactions = dh.create_interaction(events, submissions)
+    truncated = dh.truncate_data_by_nday(interactions, 1)
+    assert set(truncated.user_id) == {1, 2, 3, 4}
+    assert len(truncated[truncated.user_id == 3]) == 2
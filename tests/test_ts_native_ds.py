@@ -0,0 +1,64 @@
+""" ts_native_ds.gen_ts_features совпадает с tsfresh.extract_features """
+import numpy as np
+import pandas as pd
+import pytest
+
+from libs.data import ts_native_ds
+
+tsfresh = pytest.importorskip('tsfresh')
+from libs.data import tsfresh_ds  # noqa: E402 tsfresh_ds импортирует tsfresh
+
+KINDS = ['correct', 'discovered', 'passed', 'viewed', 'wrong']
+
+
+@pytest.fixture
+def ts_data():
+    rng = np.random.RandomState(0)
+    rows = []
+    # длины рядов: граничные случаи(1-3 точки, короче лагов) и длинные ряды
+    for user_id, length in enumerate([1, 2, 3, 5, 12, 30, 30], 1):
+        dates = rng.choice(np.arange(1500000000, 1500000000 + 100000), length, replace=False)
+        for date in dates:
+            rows.append([user_id, date] + list(rng.randint(0, 4, len(KINDS))))
+    data = pd.DataFrame(rows, columns=['user_id', 'date'] + KINDS).astype(np.float64)
+    # нулевая дисперсия ряда
+    data.loc[data.user_id == 6, 'passed'] = 2
+    # строки не по порядку пользователей и дат, как после prep_ts_interact
+    return data.sample(frac=1, random_state=1).reset_index(drop=True)
+
+
+def extract_features_long(ts_data, features=None):
+    """ признаки tsfresh по рядам в длинном формате(kind/value)
+
+    В широком формате tsfresh < 0.13 сортирует точки ряда не по его датам(см. ts_native_ds),
+    длинный формат сортируется верно во всех версиях.
+    """
+    kind_fc_params = None
+    if features is not None:
+        kind_fc_params = tsfresh.feature_extraction.settings.from_columns(features)
+    long_data = ts_data.melt(id_vars=['user_id', 'date'], var_name='kind', value_name='value')
+    ts_features = tsfresh.extract_features(long_data, column_id='user_id', column_sort='date',
+                                           column_kind='kind', column_value='value',
+                                           default_fc_parameters=tsfresh_ds.gen_fc_params(),
+                                           kind_to_fc_parameters=kind_fc_params,
+                                           disable_progressbar=True, n_jobs=0)
+    ts_features.index.name = 'user_id'
+    return ts_features
+
+
+def assert_features_equal(native, expected):
+    assert sorted(native.columns) == sorted(expected.columns)
+    native = native[expected.columns].sort_index()
+    expected = expected.sort_index()
+    np.testing.assert_array_equal(native.index.values, expected.index.values)
+    np.testing.assert_allclose(native.values, expected.values, rtol=1e-7, atol=1e-9, equal_nan=True)
+
+
+def test_all_features(ts_data):
+    assert_features_equal(ts_native_ds.gen_ts_features(ts_data), extract_features_long(ts_data))
+
+
+def test_selected_features(ts_data):
+    features = ['correct__autocorrelation__lag_0', 'correct__autocorrelation__lag_7', 'viewed__c3__lag_2',
+                'passed__skewness', 'passed__kurtosis', 'wrong__median', 'discovered__length']
+    assert_features_equal(ts_native_ds.gen_ts_features(ts_data, features), extract_features_long(ts_data, features))
@@ -0,0 +1,52 @@
+""" признаки WindowCounts для нескольких окон совпадают с расчетом по каждому окну(stream_ds.calc_user_features) """
+import numpy as np
+import pandas as pd
+import pytest
+
+import libs.data_helpers as dh
+from libs.data import stream_ds, window_ds
+
+DAY = 60 * 60 * 24
+START = 1500000000
+
+
+@pytest.fixture
+def events():
+    rng = np.random.RandomState(0)
+    actions = ['discovered', 'viewed', 'started_attempt', 'passed']
+    rows = [(rng.randint(10, 20), START + rng.randint(0, 10 * DAY), actions[rng.randint(len(actions))], user_id)
+            for user_id in range(1, 31) for _ in range(rng.randint(1, 25))]
+    # события точно на границе окна и сразу после нее
+    rows += [(10, START, 'discovered', 31), (11, START + DAY, 'viewed', 31), (12, START + DAY + 1, 'passed', 31)]
+    # строки не по порядку времени
+    return pd.DataFrame(rows, columns=['step_id', 'timestamp', 'action', 'user_id']).sample(frac=1, random_state=0)
+
+
+@pytest.fixture
+def submissions():
+    rng = np.random.RandomState(1)
+    statuses = ['wrong', 'correct']
+    # пользователи 1-10 без сабмитов, 32-35 только с сабмитами
+    rows = [(rng.randint(10, 20), START + rng.randint(0, 10 * DAY), statuses[rng.randint(len(statuses))], user_id)
+            for user_id in range(11, 36) for _ in range(rng.randint(1, 10))]
+    return pd.DataFrame(rows, columns=['step_id', 'timestamp', 'submission_status', 'user_id'])
+
+
+@pytest.mark.parametrize('n_day', [1, 2, 3, 7, 30])
+def test_same_as_calc_user_features(events, submissions, n_day):
+    expected = stream_ds.calc_user_features(events.copy(), submissions.copy(), n_day)
+    pd.testing.assert_frame_equal(window_ds.WindowCounts(events, submissions).features(n_day), expected)
+
+
+@pytest.mark.parametrize('users', [range(1, 32), range(11, 31)], ids=['without_submissions', 'all_with_both'])
+def test_users_subset(events, submissions, users):
+    events, submissions = events[events.user_id.isin(users)], submissions[submissions.user_id.isin(users)]
+    expected = stream_ds.calc_user_features(events.copy(), submissions.copy(), 2)
+    pd.testing.assert_frame_equal(window_ds.WindowCounts(events, submissions).features(2), expected)
+
+
+def test_gen_window_datasets(events, submissions):
+    features, labels = window_ds.gen_window_datasets(events, submissions, n_days=(1, 2), course_thresholds=(5, 10))
+    assert sorted(features) == [1, 2]
+    pd.testing.assert_frame_equal(features[2], stream_ds.calc_user_features(events.copy(), submissions.copy(), 2))
+    pd.testing.assert_frame_equal(labels, dh.get_labels(events, submissions, (5, 10), ('correct',)))